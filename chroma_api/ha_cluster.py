@@ -16,7 +16,9 @@ class HaClusterResource(Resource):
 
     def dehydrate_peers(self, bundle):
         hr = HostResource()
-        return [hr.full_dehydrate(hr.build_bundle(p)) for p in bundle.obj.peers]
+        peers = [hr.full_dehydrate(hr.build_bundle(p)) for p in bundle.obj.peers]
+        hr.dehydrate_locks_many(peers)
+        return peers
 
     def get_object_list(self, request):
         return HaCluster.all_clusters()
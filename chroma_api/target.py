@@ -442,9 +442,11 @@ class TargetResource(MetricResource, ConfParamResource):
         targets, command = JobSchedulerClient.create_targets([bundle.data])
 
         if request.method == 'POST':
+            target_bundle = self.full_dehydrate(self.build_bundle(obj=targets[0]))
+            self.dehydrate_locks_many([target_bundle])
             raise custom_response(self, request, http.HttpAccepted,
                                   {'command': dehydrate_command(command),
-                                   'target': self.full_dehydrate(self.build_bundle(obj=targets[0])).data})
+                                   'target': target_bundle.data})
 
     def get_resource_graph(self, request, **kwargs):
         base_bundle = self.build_bundle(request=request)
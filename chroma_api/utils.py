@@ -8,7 +8,6 @@ import traceback
 import logging
 import itertools
 from chroma_core.models.jobs import SchedulingError
-import bisect
 from collections import namedtuple
 
 
@@ -17,6 +16,7 @@ from django.http import Http404
 from django.utils import timezone
 
 from tastypie.resources import ModelDeclarativeMetaclass, Resource, ResourceOptions
+from tastypie.bundle import Bundle
 from tastypie import fields
 from tastypie import http
 from tastypie.serializers import Serializer
@@ -184,12 +184,6 @@ class StatefulModelResource(CustomModelResource):
     def dehydrate_label(self, bundle):
         return bundle.obj.get_label()
 
-    def dehydrate_locks(self, bundle):
-        obj = bundle.obj
-        obj_key = ContentType.objects.get_for_model(obj.downcast()).natural_key()
-
-        return JobSchedulerClient.get_locks(obj_key, obj.id)
-
     def alter_detail_data_to_serialize(self, request, bundle):
         """Add post dehydrate data to a single bundle
 
@@ -233,7 +227,9 @@ class StatefulModelResource(CustomModelResource):
         This method is a TastyPie hook that is called after all fields
         have been dehydrated.  The available_* methods are no longer
         dehydrated one at a time.  Instead, they are all done in two batched
-        calls, and set in the return datastructure here.
+        calls, and set in the return datastructure here.  Likewise the locks
+        of all the objects, and of stateful objects nested in them as full
+        related fields, are fetched with a single batch of RPCs.
 
         to_be_serialized is a list of TastyPie Bundles composing some
         subclass of StatefulObjects under the key 'objects.
@@ -248,6 +244,7 @@ class StatefulModelResource(CustomModelResource):
 
         computed_transitions = JobSchedulerClient.available_transitions(batch)
         computed_jobs = JobSchedulerClient.available_jobs(batch)
+        self.dehydrate_locks_many(to_be_serialized['objects'])
 
         #  decorate the transition lists with verbs
         #  and install in the bundle for return
@@ -268,6 +265,34 @@ class StatefulModelResource(CustomModelResource):
 
         return to_be_serialized
 
+    @classmethod
+    def dehydrate_locks_many(cls, bundles):
+        """Set the locks of the objects of bundles, and of stateful objects nested in them as
+        full related fields, with a single batch of RPCs.  Use this for bundles which don't
+        pass through alter_list_data_to_serialize, such as those nested in other resources."""
+        lock_bundles = []
+        for bundle in bundles:
+            lock_bundles.append(bundle)
+            lock_bundles.extend(cls._nested_stateful_bundles(bundle))
+
+        batch = [(ContentType.objects.get_for_model(bundle.obj.downcast()).natural_key(), bundle.obj.id)
+                 for bundle in lock_bundles]
+        for bundle, locks in zip(lock_bundles, JobSchedulerClient.get_locks_many(batch)):
+            bundle.data['locks'] = locks
+
+    @classmethod
+    def _nested_stateful_bundles(cls, bundle):
+        """Return the bundles of stateful objects dehydrated within bundle as full related
+        fields, at any depth."""
+        nested_bundles = []
+        for value in bundle.data.values():
+            for nested in value if isinstance(value, list) else [value]:
+                if isinstance(nested, Bundle):
+                    if 'locks' in nested.data:
+                        nested_bundles.append(nested)
+                    nested_bundles.extend(cls._nested_stateful_bundles(nested))
+        return nested_bundles
+
     # PUT handler for accepting {'state': 'foo', 'dry_run': <true|false>}
     def obj_update(self, bundle, **kwargs):
         self.is_valid(bundle)
@@ -502,15 +527,19 @@ class MetricResource:
         # Want an overall reduction into one series
         if reduce_fn not in ('sum', 'average'):
             raise NotImplementedError
-        datetimes = dict((obj_id, sorted(data)) for obj_id, data in results.items())
+        # Sweep all timestamps in order, carrying each object's data forward from its previous timestamp.
+        # Before its first timestamp, an object contributes its earliest data.
+        current, updates = [], defaultdict(list)
+        for index, stats in enumerate(results.values()):
+            current.append(stats[min(stats)] if stats else {})
+            for dt in stats:
+                updates[dt].append((index, stats[dt]))
         result = {}
-        for dt in set(itertools.chain(*datetimes.values())):
+        for dt in sorted(updates):
+            for index, data in updates[dt]:
+                current[index] = data
             result[dt] = counter = Counter.fromkeys(metrics, 0.0)
-            for obj_id, stats in results.items():
-                data = stats.get(dt, {})
-                dts = datetimes[obj_id]
-                if dts and not data:  # Didn't have one for this exact timestamp, do we have one before?
-                    data = stats[dts[max(bisect.bisect(dts, dt) - 1, 0)]]
+            for data in current:
                 counter.update(data)
             if reduce_fn == 'average':
                 for name in counter:
@@ -532,7 +561,12 @@ class MetricResource:
             raise custom_response(self, request, http.HttpNotFound, {'metrics': exc})
         metrics = metrics or set(itertools.chain.from_iterable(MetricStore(obj).names for obj in objs))
 
-        result = dict((obj.id, self._fetch(MetricStore(obj), metrics, begin, end, job, max_points, num_points)) for obj in objs)
+        if job:
+            result = dict((obj.id, self._fetch(MetricStore(obj), metrics, begin, end, job, max_points, num_points)) for obj in objs)
+        elif begin and end:
+            result = dict((obj.id, stats) for obj, stats in MetricStore.fetch_many(objs, metrics, begin, end, max_points, num_points))
+        else:
+            result = dict((obj.id, dict([latest])) for obj, latest in MetricStore.fetch_last_many(objs, metrics))
         if not reduce_fn:
             for obj_id, stats in result.items():
                 result[obj_id] = self._format(stats)
@@ -9,7 +9,8 @@ import collections
 from datetime import datetime
 from chroma_core.services import log_register
 from django.utils.timezone import utc
-from chroma_core.models import Point, Series, Stats, ManagedHost, ManagedTarget, ManagedFilesystem
+from django.contrib.contenttypes.models import ContentType
+from chroma_core.models import Point, Series, Stats, ManagedHost, ManagedTarget, ManagedFilesystem, ManagedOst, ManagedMdt
 from chroma_core.lib.storage_plugin.api import statistics
 from chroma_core.lib import scheduler
 
@@ -62,27 +63,60 @@ class MetricStore(object):
 
     def fetch(self, fetch_metrics, begin, end, max_points=float('inf'), num_points=0):
         "Return datetimes with dicts of field names and values."
-        result = collections.defaultdict(dict)
-        types = set()
+        (measured_object, result), = self.fetch_many([self.measured_object], fetch_metrics, begin, end, max_points, num_points)
+        return result
+
+    @classmethod
+    def fetch_many(cls, measured_objects, fetch_metrics, begin, end, max_points=float('inf'), num_points=0):
+        """Generate measured objects with the result of fetch for each.
+        All series are selected together, with one query per resolution instead of one per series.
+        """
+        measured_objects = list(measured_objects)
+        stores = [cls(measured_object) for measured_object in measured_objects]
         end = Stats[0].floor(end)  # exclude points from a partial sample
-        for series in Series.filter(self.measured_object, name__in=fetch_metrics):
-            types.add(series.type)
-            minimum = 0.0 if series.type == 'Counter' else float('-inf')
-            for point in Stats.select(series.id, begin, end, rate=series.type in ('Counter', 'Derive'), maxlen=max_points, fixed=num_points):
-                result[point.dt][series.name] = max(minimum, point.mean)
-        # if absolute and derived values are mixed, the earliest value will be incomplete
-        if result and types > set(['Gauge']) and len(result[min(result)]) < len(fetch_metrics):
-            del result[min(result)]
-        return dict(result)
+        series = collections.defaultdict(list)
+        for item in Series.filter_many([store.measured_object for store in stores], name__in=fetch_metrics):
+            series[item.content_type_id, item.object_id].append(item)
+        rates = set(item.id for items in series.values() for item in items if item.type in ('Counter', 'Derive'))
+        points = Stats.select_many([item.id for items in series.values() for item in items], begin, end, rates, max_points, num_points)
+        for measured_object, store in zip(measured_objects, stores):
+            ct = ContentType.objects.get_for_model(store.measured_object)
+            result = collections.defaultdict(dict)
+            types = set()
+            for item in series[ct.id, store.measured_object.id]:
+                types.add(item.type)
+                minimum = 0.0 if item.type == 'Counter' else float('-inf')
+                for point in points[item.id]:
+                    result[point.dt][item.name] = max(minimum, point.mean)
+            # if absolute and derived values are mixed, the earliest value will be incomplete
+            if result and types > set(['Gauge']) and len(result[min(result)]) < len(fetch_metrics):
+                del result[min(result)]
+            yield measured_object, dict(result)
 
     def fetch_last(self, fetch_metrics):
         "Return latest datetime and dict of field names and values."
-        latest, data = datetime.fromtimestamp(0, utc), {}
-        for series in Series.filter(self.measured_object, name__in=fetch_metrics):
-            point = Stats.latest(series.id)
-            data[series.name] = point.mean
-            latest = max(latest, point.dt)
-        return latest, data
+        (measured_object, result), = self.fetch_last_many([self.measured_object], fetch_metrics)
+        return result
+
+    @classmethod
+    def fetch_last_many(cls, measured_objects, fetch_metrics):
+        """Generate measured objects with the result of fetch_last for each.
+        Latest points of all series are read together from the snapshot, without querying samples.
+        """
+        measured_objects = list(measured_objects)
+        stores = [cls(measured_object) for measured_object in measured_objects]
+        series = collections.defaultdict(list)
+        for item in Series.filter_many([store.measured_object for store in stores], name__in=fetch_metrics):
+            series[item.content_type_id, item.object_id].append(item)
+        points = Stats.latest_many([item.id for items in series.values() for item in items])
+        for measured_object, store in zip(measured_objects, stores):
+            ct = ContentType.objects.get_for_model(store.measured_object)
+            latest, data = datetime.fromtimestamp(0, utc), {}
+            for item in series[ct.id, store.measured_object.id]:
+                point = points[item.id]
+                data[item.name] = point.mean
+                latest = max(latest, point.dt)
+            yield measured_object, (latest, data)
 
     def fetch_jobs(self, metric, begin, end, job, max_points=float('inf'), num_points=0):
         "Return datetimes with dicts of field names and values."
@@ -253,12 +287,25 @@ class TargetMetricStore(MetricStore):
 class FilesystemMetricStore(MetricStore):
     """
     Wrapper class for Filesystem-level aggregate metrics.  Read-only.
+
+    The stats service maintains aggregate series of the filesystem for the target metrics in AGGREGATES,
+    named with the target kind, e.g. 'ost_kbytesfree'.  Only gauges are aggregated, as the sum of
+    the members' counters is not a counter itself.
     """
+    AGGREGATES = {ManagedOst: ('ost', ['kbytesfree', 'kbytestotal', 'filesfree', 'filestotal']),
+                  ManagedMdt: ('mdt', ['kbytesfree', 'kbytestotal', 'filesfree', 'filestotal'])}
+
     def __init__(self, managed_object, *args, **kwargs):
         # Override the parent __init__(), as we don't need an R3D for
         # a Filesystem.
         self.filesystem = managed_object
 
+    @classmethod
+    def aggregate_name(cls, target_class, name):
+        "Return name of the filesystem series aggregating a target metric, or None if it isn't aggregated."
+        prefix, names = cls.AGGREGATES.get(target_class, (None, ()))
+        return '{0}_{1}'.format(prefix, name) if name in names else None
+
     def serialize(self, *args, **kwargs):
         """Don't use this -- will raise a NotImplementedError!"""
         raise NotImplementedError("Filesystem-level serialize() not supported!")
@@ -272,10 +319,102 @@ class FilesystemMetricStore(MetricStore):
         and an optional list of desired metrics, returns a tuple
         containing a single row of aggregate datapoints taken
         from each metric's last reading.
+
+        Aggregate series are read if they are available, otherwise the targets are summed.
         """
-        latest, counter = datetime.fromtimestamp(0, utc), Counter()
-        for target in target_class.objects.filter(filesystem=self.filesystem):
-            dt, data = target.metrics.fetch_last(fetch_metrics)
+        names = [self.aggregate_name(target_class, name) for name in fetch_metrics]
+        latest = datetime.fromtimestamp(0, utc)
+        if names and None not in names:
+            try:
+                series = [Series.get(self.filesystem, name) for name in names]
+            except Series.DoesNotExist:
+                pass
+            else:
+                data = {}
+                points = Stats.latest_many([item.id for item in series])
+                for name, item in zip(fetch_metrics, series):
+                    point = points[item.id]
+                    data[name] = point.mean
+                    latest = max(latest, point.dt)
+                return latest, data
+        counter = Counter()
+        targets = target_class.objects.filter(filesystem=self.filesystem)
+        for target, (dt, data) in MetricStore.fetch_last_many(targets, fetch_metrics):
             counter.update(data)
             latest = max(latest, dt)
         return latest, dict(counter)
+
+
+class FilesystemAggregator(object):
+    """
+    Maintains the aggregate series of filesystems from incoming target samples.  Used by the stats service.
+
+    The latest value of every member target series is kept in memory, so each sample of a member
+    produces an aggregate sample of the sum for its filesystem.  Membership is refreshed periodically
+    to account for added and removed targets.  Aggregate samples are stamped with the newest member
+    timestamp, but never earlier than the last one emitted, so they aren't rejected as outdated.
+    """
+    TTL = 300
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.keys = {}                                  # series id -> (filesystem id, target class, name) or None
+        self.members = collections.defaultdict(dict)    # aggregate key -> {member series id: latest value}
+        self.series = {}                                # aggregate key -> aggregate series id
+        self.emitted = {}                               # aggregate key -> latest aggregate timestamp
+        self.expires = time.time() + self.TTL
+
+    def resolve(self, ids):
+        "Map unknown series ids to aggregate keys, loading all members of newly found aggregates."
+        unknown = set(ids).difference(self.keys)
+        self.keys.update(dict.fromkeys(unknown))
+        for target_class, (prefix, names) in FilesystemMetricStore.AGGREGATES.items():
+            if not unknown:
+                break
+            ct = ContentType.objects.get_for_model(target_class)
+            series = list(Series.objects.filter(id__in=unknown, content_type=ct, name__in=names, type='Gauge'))
+            filesystems = dict(target_class.objects.filter(id__in=[item.object_id for item in series]).values_list('id', 'filesystem_id'))
+            for item in series:
+                if item.object_id not in filesystems:
+                    continue
+                key = filesystems[item.object_id], target_class, item.name
+                if key not in self.series:
+                    self.load(key, item.type)
+                self.keys[item.id] = key
+            unknown.difference_update(item.id for item in series)
+
+    def load(self, key, type):
+        "Load aggregate series and the latest values of all its members."
+        filesystem_id, target_class, name = key
+        filesystem = ManagedFilesystem.objects.get(id=filesystem_id)
+        self.series[key] = Series.get(filesystem, FilesystemMetricStore.aggregate_name(target_class, name), type).id
+        self.emitted[key] = Stats[0].latest(self.series[key]).dt
+        targets = target_class.objects.filter(filesystem_id=filesystem_id).values('id')
+        ct = ContentType.objects.get_for_model(target_class)
+        ids = Series.objects.filter(content_type=ct, object_id__in=targets, name=name).values_list('id', flat=True)
+        for id, point in Stats.latest_many(ids).items():
+            self.members[key][id] = point.mean
+            self.keys[id] = key
+
+    def serialize(self, samples):
+        """Return serialized aggregate samples (id, dt, value) for the filesystems of member series in samples.
+        Aggregates with no member newer than the last emitted sample are skipped;  the next update of a member refreshes them.
+        """
+        if time.time() > self.expires:
+            self.clear()
+        samples = list(samples)
+        self.resolve(id for id, dt, value in samples)
+        updated = {}
+        for id, dt, value in samples:
+            key = self.keys[id]
+            if key is not None:
+                self.members[key][id] = value
+                updated[key] = max(dt, updated.get(key, dt))
+        result = []
+        for key, dt in updated.items():
+            if dt > self.emitted[key]:
+                self.emitted[key] = dt
+                result.append((self.series[key], dt, sum(self.members[key].values())))
+        return result
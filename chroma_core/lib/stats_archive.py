@@ -0,0 +1,141 @@
+# Copyright (c) 2018 DDN. All rights reserved.
+# Use of this source code is governed by a MIT-style
+# license that can be found in the LICENSE file.
+
+
+"""Compact encoding of stats points for long term archives.
+
+A chunk of points (timestamp, sum, len) from a single series is packed into a bit stream:
+timestamps as delta-of-deltas in units of the sample step, sums as the XOR of consecutive
+float bit patterns (as in Facebook's Gorilla), and lens as repeats of the previous value.
+Regularly sampled series compress to a few bits per point.
+"""
+
+
+import struct
+import binascii
+
+# bit lengths of delta-of-delta buckets, prefixed by 10, 110, 1110, and 1111 respectively
+DOD_LENGTHS = 7, 9, 12, 64
+
+
+def float_bits(value):
+    return struct.unpack('>Q', struct.pack('>d', value))[0]
+
+
+def bits_float(bits):
+    return struct.unpack('>d', struct.pack('>Q', bits))[0]
+
+
+class BitWriter(object):
+    def __init__(self):
+        self.value = self.length = 0
+
+    def write(self, value, length):
+        "Append the low bits of value, so negative values are written as two's complement."
+        self.value = (self.value << length) | (value & ((1 << length) - 1))
+        self.length += length
+
+    def getvalue(self):
+        padding = -self.length % 8
+        digits = '{0:x}'.format(self.value << padding)
+        return binascii.unhexlify(digits.zfill((self.length + padding) // 4))
+
+
+class BitReader(object):
+    def __init__(self, data):
+        self.value = int(binascii.hexlify(data), 16) if data else 0
+        self.length = len(data) * 8
+        self.position = 0
+
+    def read(self, length):
+        self.position += length
+        return (self.value >> (self.length - self.position)) & ((1 << length) - 1)
+
+    def signed(self, length):
+        value = self.read(length)
+        return value - (1 << length) if value >> (length - 1) else value
+
+
+def encode(points, step):
+    "Return string of packed points (timestamp, sum, len), ordered by timestamps which are multiples of step."
+    writer = BitWriter()
+    writer.write(len(points), 32)
+    if not points:
+        return writer.getvalue()
+    timestamp, sum, len_ = points[0]
+    assert timestamp % step == 0
+    timestamp //= step
+    bits = float_bits(sum)
+    writer.write(timestamp, 64)
+    writer.write(bits, 64)
+    writer.write(len_, 32)
+    delta, window = 0, None
+    for point in points[1:]:
+        assert point[0] % step == 0
+        dod = point[0] // step - timestamp - delta
+        delta += dod
+        timestamp += delta
+        if not dod:
+            writer.write(0, 1)
+        else:
+            for ones, length in enumerate(DOD_LENGTHS, 1):
+                if ones == len(DOD_LENGTHS) or -(1 << (length - 1)) <= dod < (1 << (length - 1)):
+                    # a run of ones, terminated by a zero unless it's the longest
+                    writer.write((1 << ones) - 1, ones)
+                    if ones < len(DOD_LENGTHS):
+                        writer.write(0, 1)
+                    writer.write(dod, length)
+                    break
+
+        xor = bits ^ float_bits(point[1])
+        bits ^= xor
+        if not xor:
+            writer.write(0, 1)
+        else:
+            leading, trailing = min(64 - xor.bit_length(), 31), (xor & -xor).bit_length() - 1
+            if window and leading >= window[0] and trailing >= window[1]:
+                writer.write(0b10, 2)
+            else:
+                window = leading, trailing
+                writer.write(0b11, 2)
+                writer.write(leading, 5)
+                writer.write(63 - leading - trailing, 6)
+            writer.write(xor >> window[1], 64 - window[0] - window[1])
+
+        if point[2] == len_:
+            writer.write(0, 1)
+        else:
+            len_ = point[2]
+            writer.write(1, 1)
+            writer.write(len_, 32)
+    return writer.getvalue()
+
+
+def decode(data, step):
+    "Return list of points (timestamp, sum, len) from a string packed by encode."
+    reader = BitReader(data)
+    count = reader.read(32)
+    if not count:
+        return []
+    timestamp, bits, len_ = reader.signed(64), reader.read(64), reader.read(32)
+    points = [(timestamp * step, bits_float(bits), len_)]
+    delta, window = 0, None
+    for index in xrange(count - 1):
+        ones = 0
+        while ones < len(DOD_LENGTHS) and reader.read(1):
+            ones += 1
+        if ones:
+            delta += reader.signed(DOD_LENGTHS[ones - 1])
+        timestamp += delta
+
+        if reader.read(1):
+            if reader.read(1):
+                leading = reader.read(5)
+                window = leading, 64 - leading - (reader.read(6) + 1)
+            bits ^= reader.read(64 - window[0] - window[1]) << window[1]
+
+        if reader.read(1):
+            len_ = reader.read(32)
+        points.append((timestamp * step, bits_float(bits), len_))
+    return points
@@ -25,6 +25,8 @@ from chroma_core.services.rpc import RpcClientFactory
 from iml_common.lib.date_time import IMLDateTime
 import chroma_core.services.log
 
+import settings
+
 
 log = log_register(__name__.split('.')[-1])
 
@@ -35,6 +37,7 @@ class Command(BaseCommand):
     option_list = BaseCommand.option_list + (
         make_option('--gevent', action = 'store_true', dest = 'gevent', default = False),
         make_option('--lightweight-rpc', action = 'store_true', dest = 'lightweight_rpc', default = False),
+        make_option('--local-transport', action = 'store_true', dest = 'local_transport', default = False),
         make_option('--verbose', action = 'store_true', dest = 'verbose', default = False),
         make_option('--console', action = 'store_true', dest= 'console', default = False),
         make_option('--name', dest = 'name', default = 'chroma_service'),
@@ -114,6 +117,9 @@ class Command(BaseCommand):
             chroma_core.services.log.trace = Trace()
             sys.settrace(chroma_core.services.log.trace)
 
+        if options['local_transport']:
+            settings.SERVICE_TRANSPORT = 'local'
+
         from chroma_core.lib.service_config import ServiceConfig
         if not ServiceConfig().configured():
             sys.stderr.write("IML is not configured, please run chroma-config setup first\n")
@@ -148,6 +154,11 @@ class Command(BaseCommand):
                 log.info("Joining %s" % service_thread.service.name)
                 service_thread.join()
 
+            if settings.SERVICE_TRANSPORT == 'local':
+                # Not imported earlier, as its lock must be created after any gevent monkey patching
+                from chroma_core.services import local_transport
+                local_transport.shutdown()
+
             stopped.set()
 
         if options['gevent']:
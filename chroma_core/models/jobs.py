@@ -120,54 +120,28 @@ class StatefulObject(models.Model):
                 transition_options[from_state].append(to_state)
                 job_class_map[(from_state, to_state)] = c
 
+        # Breadth first search from each state finds the shortest route to every state
+        # reachable from it, in time linear in the number of transitions.
         transition_map = defaultdict(list)
         route_map = {}
         for begin_state in cls_.states:
-            all_routes = set()
-
-            # Enumerate all possible routes from this state
-            def get_routes(stack, explore_state):
-                if explore_state in stack:
-                    all_routes.add(tuple(stack))
-                    return
-
-                stack = stack + [explore_state]
-
-                if len(transition_options[explore_state]) == 0:
-                    if len(stack) > 1:
-                        all_routes.add(tuple(stack))
-                    return
-
-                for next_state in transition_options[explore_state]:
-                    get_routes(stack, next_state)
-
-            get_routes([], begin_state)
-
-            # For all valid routes with more than 2 states,
-            # all truncations of 2 or more states are also valid routes.
-            truncations = set()
-            for r in all_routes:
-                for i in range(2, len(r)):
-                    truncations.add(tuple(r[0:i]))
-            all_routes = all_routes | truncations
-
-            routes = defaultdict(list)
-            # Build a map of end state to list of ways of getting there
-            for route in all_routes:
-                routes[route[-1]].append(route)
-
-            # Pick the shortest route to each end state
-            for (end_state, possible_routes) in routes.items():
-                possible_routes.sort(lambda a, b: cmp(len(a), len(b)))
-                shortest_route = possible_routes[0]
-
-                transition_map[begin_state].append(end_state)
-                route_map[(begin_state, end_state)] = shortest_route
-
-        cls_.route_map = route_map
+            routes = {begin_state: (begin_state,)}
+            explore_states = [begin_state]
+            while explore_states:
+                next_states = []
+                for explore_state in explore_states:
+                    for next_state in transition_options[explore_state]:
+                        if next_state not in routes:
+                            routes[next_state] = routes[explore_state] + (next_state,)
+                            transition_map[begin_state].append(next_state)
+                            route_map[(begin_state, next_state)] = routes[next_state]
+                            next_states.append(next_state)
+                explore_states = next_states
+
+        # route_map is assigned last, as its presence marks the maps as built
         cls_.transition_map = transition_map
-
         cls_.job_class_map = job_class_map
+        cls_.route_map = route_map
 
     @classmethod
     def get_route(cls, begin_state, end_state):
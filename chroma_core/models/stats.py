@@ -3,22 +3,28 @@
 # license that can be found in the LICENSE file.
 
 
+import sys
+import time
+import array
 import itertools
 import collections
 import calendar
 import operator
 import functools
+import cStringIO
+import base64
 from datetime import datetime, timedelta
-from django.db import models
+from django.db import models, connections, transaction, IntegrityError
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes import generic
 from django.utils.timezone import utc
 from chroma_core.lib.util import chroma_settings
+from chroma_core.lib import stats_archive
 
 settings = chroma_settings()
 
 
-__all__ = 'Point', 'Series', 'Stats'
+__all__ = 'Point', 'Series', 'LatestSample', 'SampleArchive', 'Stats'
 
 
 def total_seconds(td):
@@ -72,14 +78,113 @@ epoch = datetime.fromtimestamp(0, utc)
 Point.zero = Point(epoch, 0.0, 0)
 
 
-class Cache(collections.defaultdict):
-    "Simple cache of limited size;  doesn't need to be LRU yet."
+class Columns(object):
+    """Columnar batch of points from multiple series:  parallel arrays of ids, epoch seconds, sums, and lens.
+    Grouped reductions over the arrays avoid per-point datetime arithmetic and Point allocation.
+    """
+    __slots__ = 'ids', 'timestamps', 'sums', 'lens'
+
+    def __init__(self):
+        self.ids, self.timestamps, self.lens = array.array('l'), array.array('l'), array.array('l')
+        self.sums = array.array('d')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def extend(self, id, points):
+        "Append points for a series;  points must be ordered by datetime."
+        for point in points:
+            self.ids.append(id)
+            self.timestamps.append(timestamp(point.dt))
+            self.sums.append(point.sum)
+            self.lens.append(point.len)
+
+    def reduce(self, step):
+        "Return columns grouped by series id and sample size, equivalent to Sample.reduce per series."
+        result = type(self)()
+        ids, timestamps, sums, lens = self.ids, self.timestamps, self.sums, self.lens
+        key = None
+        for index in xrange(len(ids)):
+            id, ts = ids[index], timestamps[index]
+            ts -= ts % step
+            if (id, ts) == key:
+                result.sums[-1] += sums[index]
+                result.lens[-1] += lens[index]
+            else:
+                key = id, ts
+                result.ids.append(id)
+                result.timestamps.append(ts)
+                # same summation order as adding to Point.zero
+                result.sums.append(0.0 + sums[index])
+                result.lens.append(0 + lens[index])
+        return result
+
+    def groups(self):
+        "Generate series ids with lists of Points."
+        datetimes = {}
+        ids, timestamps, sums, lens = self.ids, self.timestamps, self.sums, self.lens
+        start = 0
+        for stop in xrange(1, len(ids) + 1):
+            if stop == len(ids) or ids[stop] != ids[start]:
+                points = []
+                for index in xrange(start, stop):
+                    ts = timestamps[index]
+                    if ts not in datetimes:
+                        datetimes[ts] = epoch + timedelta(seconds=ts)
+                    points.append(Point(datetimes[ts], sums[index], lens[index]))
+                yield ids[start], points
+                start = stop
+
+
+class Cache(object):
+    """Bounded LRU cache, with an optional default factory like defaultdict.
+    Evicts the least recently used entries one at a time, and counts hits, misses, and evictions.
+    """
     SIZE = 1e5
 
+    def __init__(self, default_factory=None):
+        self.default_factory = default_factory
+        self.data = collections.OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __getitem__(self, key):
+        try:
+            value = self.data.pop(key)
+        except KeyError:
+            self.misses += 1
+            if self.default_factory is None:
+                raise
+            value = self.default_factory()
+        else:
+            self.hits += 1
+        self[key] = value
+        return value
+
     def __setitem__(self, key, value):
-        collections.defaultdict.__setitem__(self, key, value)
-        if len(self) > self.SIZE:
-            self.clear()
+        self.data.pop(key, None)
+        self.data[key] = value
+        while len(self.data) > self.SIZE:
+            del self.data[next(iter(self.data))]
+            self.evictions += 1
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+    def clear(self):
+        self.data.clear()
+
+    def info(self):
+        "Return dict of size and hit, miss, and eviction counts."
+        return {'size': len(self.data), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
 
 
 class Series(models.Model):
@@ -98,7 +203,7 @@ class Series(models.Model):
         app_label = 'chroma_core'
         unique_together = ('content_type', 'object_id', 'name'),
 
-    cache = Cache(None)
+    cache = Cache()
 
     @classmethod
     def get(cls, obj, name, type=''):
@@ -121,11 +226,23 @@ class Series(models.Model):
         ct = ContentType.objects.get_for_model(obj)
         return cls.objects.filter(content_type=ct, object_id=obj.id, **kwargs)
 
+    @classmethod
+    def filter_many(cls, objs, **kwargs):
+        "Return queryset filtered for multiple measured objects."
+        ids = collections.defaultdict(list)
+        for obj in objs:
+            ids[ContentType.objects.get_for_model(obj)].append(obj.id)
+        if not ids:
+            return cls.objects.none()
+        query = reduce(operator.or_, (models.Q(content_type=ct, object_id__in=ids[ct]) for ct in ids))
+        return cls.objects.filter(query, **kwargs)
+
 
 class Sample(models.Model):
     """Abstract model for Sample tables.
     Only used for query generation.
-    Subclasses require 'step', 'expiration_time', and 'cache' attributes.
+    Subclasses require 'step', 'expiration_time', 'cache', 'maxlen', 'buffer', 'partition_ranges', and 'next_pack_time' attributes.
+    Partitions span the flush interval, so expiry of partitioned points has the same granularity as a simple wipe.
     """
     id = models.IntegerField(primary_key=True)  # for django only, not really the primary key
     dt = models.DateTimeField(db_index=True)
@@ -141,6 +258,18 @@ class Sample(models.Model):
         "Return most recent data point for series."
         return (cls.cache[id] or list(cls.select(id, order_by='-dt', limit=1)) or [Point.zero])[-1]
 
+    @classmethod
+    def preload(cls, since):
+        "Populate cache with the most recent points of all series sampled since datetime.  Return number of series."
+        query = cls.objects.filter(dt__gte=since).order_by('id', 'dt').values_list('id', *Point._fields)
+        count = 0
+        for id, rows in itertools.groupby(query.iterator(), key=operator.itemgetter(0)):
+            cache = cls.cache[id]
+            cache.clear()
+            cache.extend(Point(*row[1:]) for row in rows)
+            count += 1
+        return count
+
     @classmethod
     def start(cls, id):
         "Return earliest datetime that should be stored for series."
@@ -149,6 +278,30 @@ class Sample(models.Model):
         except OverflowError:
             return epoch
 
+    @classmethod
+    def starts(cls, ids):
+        "Return mapping of series ids to start datetimes, querying all uncached series together."
+        latest = {}
+        for id in ids:
+            cache = cls.cache[id]
+            if cache:
+                latest[id] = cache[-1].dt
+        missing = set(ids).difference(latest)
+        if missing:
+            query = cls.objects.filter(id__in=missing).values('id').annotate(latest=models.Max('dt'))
+            latest.update(query.values_list('id', 'latest'))
+        missing.difference_update(latest)
+        if missing and cls.archived():
+            query = SampleArchive.objects.filter(step=cls.step, id__in=missing)
+            latest.update(query.values('id').annotate(latest=models.Max('last')).values_list('id', 'latest'))
+        starts = {}
+        for id in ids:
+            try:
+                starts[id] = latest.get(id, Point.zero.dt) - cls.expiration_time
+            except OverflowError:
+                starts[id] = epoch
+        return starts
+
     @classmethod
     def floor(cls, dt):
         "Return datetime rounded down to nearest sample size."
@@ -162,18 +315,136 @@ class Sample(models.Model):
 
     @classmethod
     def select(cls, id, order_by='dt', limit=None, **filters):
-        "Generate points for a series."
+        """Generate points for a series.
+        Archived points are included, provided the only filters are on the range of datetimes.
+        """
         query = cls.objects.filter(id=id, **filters).order_by(order_by)[:limit]
-        return itertools.starmap(Point, query.values_list(*Point._fields))
+        points = itertools.starmap(Point, query.values_list(*Point._fields))
+        if not cls.archived() or set(filters).difference(['dt__gte', 'dt__lt']):
+            return points
+        archived = SampleArchive.generate(cls.step, id, reverse=order_by.startswith('-'), **filters)
+        points = itertools.chain(points, archived) if order_by.startswith('-') else itertools.chain(archived, points)
+        return itertools.islice(points, limit)
 
     @classmethod
     def insert(cls, stats):
         "Bulk insert mapping of series ids to points."
         if stats:
-            cls.objects.bulk_create(cls(id, *point) for id in stats for point in stats[id])
+            if connections[cls.objects.db].vendor == 'postgresql':
+                cls.copy(stats)
+            else:
+                cls.objects.bulk_create(cls(id, *point) for id in stats for point in stats[id])
         for id in stats:
             cls.cache[id] += sorted(stats[id])
 
+    @classmethod
+    def copy(cls, stats):
+        """Bulk insert mapping of series ids to points with COPY FROM STDIN (postgres only).
+        Rows are serialized into the class's buffer, which is reused to avoid reallocating for each message.
+        If partitioned, rows are copied directly into the partition for their datetimes.
+        """
+        tables = {cls._meta.db_table: stats}
+        if cls.partitioned():
+            tables = collections.defaultdict(lambda: collections.defaultdict(list))
+            for id in stats:
+                for point in stats[id]:
+                    tables[cls.partition(point.dt)][id].append(point)
+        import psycopg2
+        connection = connections[cls.objects.db]
+        columns = [field.column for field in cls._meta.local_fields]
+        for table in tables:
+            buffer = cls.buffer
+            buffer.seek(0)
+            buffer.truncate()
+            for id in tables[table]:
+                for dt, sum, len in tables[table][id]:
+                    buffer.write('{0:d}\t{1}\t{2!r}\t{3:d}\n'.format(id, dt.isoformat(), float(sum), len))
+            buffer.seek(0)
+            start = time.time()
+            try:
+                connection.cursor().copy_from(buffer, table, columns=columns)
+            except psycopg2.IntegrityError as exc:
+                raise IntegrityError, IntegrityError(*exc.args), sys.exc_info()[2]
+            finally:
+                # COPY bypasses the debug cursor, so record it the same way for query logging
+                if connection.use_debug_cursor or (connection.use_debug_cursor is None and settings.DEBUG):
+                    sql = 'COPY {0} ({1}) FROM STDIN'.format(table, ', '.join(columns))
+                    connection.queries.append({'sql': sql, 'time': '%.3f' % (time.time() - start)})
+        transaction.commit_unless_managed(using=cls.objects.db)
+
+    @classmethod
+    def partitioned(cls):
+        "Return whether points are stored in time range partitions (postgres only)."
+        return settings.STATS_PARTITIONED and connections[cls.objects.db].vendor == 'postgresql'
+
+    @classmethod
+    def partitions(cls):
+        "Return mapping of partition table names to their time ranges as timestamps (start, stop)."
+        if cls.partition_ranges is None:
+            cursor = connections[cls.objects.db].cursor()
+            cursor.execute('SELECT child.relname FROM pg_inherits '
+                           'JOIN pg_class child ON child.oid = pg_inherits.inhrelid '
+                           'JOIN pg_class parent ON parent.oid = pg_inherits.inhparent WHERE parent.relname = %s',
+                           [cls._meta.db_table])
+            prefix = cls._meta.db_table + '_p'
+            cls.partition_ranges = dict((name, tuple(map(int, name[len(prefix):].split('_'))))
+                                        for name, in cursor.fetchall() if name.startswith(prefix))
+        return cls.partition_ranges
+
+    @classmethod
+    def partition(cls, dt):
+        "Return name of the partition table for datetime, creating it as necessary."
+        width = int(total_seconds(cls.flush_orphans_interval))
+        start = timestamp(dt) - timestamp(dt) % width
+        name = '{0}_p{1:d}_{2:d}'.format(cls._meta.db_table, start, start + width)
+        partitions = cls.partitions()
+        if name not in partitions:
+            cursor = connections[cls.objects.db].cursor()
+            bounds = [epoch + timedelta(seconds=start), epoch + timedelta(seconds=start + width)]
+            cursor.execute('CREATE TABLE {0} (CHECK (dt >= %s AND dt < %s)) INHERITS ({1})'.format(name, cls._meta.db_table), bounds)
+            cursor.execute('CREATE UNIQUE INDEX {0}_id_dt ON {0} (id, dt)'.format(name))
+            cursor.execute('CREATE INDEX {0}_dt ON {0} (dt)'.format(name))
+            transaction.commit_unless_managed(using=cls.objects.db)
+            partitions[name] = start, start + width
+        return name
+
+    @classmethod
+    def drop_partitions(cls, before):
+        "Drop partitions which only hold points older than datetime, and delete older unpartitioned points."
+        cursor = connections[cls.objects.db].cursor()
+        partitions = cls.partitions()
+        for name, (start, stop) in partitions.items():
+            if stop <= timestamp(before):
+                cursor.execute('DROP TABLE {0}'.format(name))
+                del partitions[name]
+        cursor.execute('DELETE FROM ONLY {0} WHERE dt < %s'.format(cls._meta.db_table), [before])
+        transaction.commit_unless_managed(using=cls.objects.db)
+
+    @classmethod
+    def archived(cls):
+        "Return whether old points are packed into archives."
+        return settings.STATS_ARCHIVE and cls.step >= SampleArchive.MIN_STEP
+
+    @classmethod
+    def pack(cls, before):
+        """Move points older than the archive window containing datetime into archives, and delete them.
+        Return number of points archived.
+        """
+        width = cls.step * SampleArchive.POINTS
+        before = epoch + timedelta(seconds=timestamp(before) // width * width)
+        query = cls.objects.filter(dt__lt=before).order_by('id', 'dt').values_list('id', *Point._fields)
+        key = lambda row: (row[0], timestamp(row[1]) // width * width)
+        archives, count = [], 0
+        for (id, start), rows in itertools.groupby(query.iterator(), key):
+            archives.append((id, epoch + timedelta(seconds=start), [Point(*row[1:]) for row in rows]))
+            count += len(archives[-1][-1])
+            if len(archives) >= SampleArchive.BATCH:
+                SampleArchive.store(cls.step, archives)
+                archives = []
+        SampleArchive.store(cls.step, archives)
+        cls.delete(dt__lt=before)
+        return count
+
     @classmethod
     def delete(cls, **filters):
         "Delete points in bulk."
@@ -183,7 +454,13 @@ class Sample(models.Model):
 
     @classmethod
     def expire(cls, ids):
-        if settings.STATS_SIMPLE_WIPE:
+        if cls.partitioned():
+            "Expired points are dropped a whole partition at a time."
+            now = datetime.now(utc)
+            if now > cls.next_flush_orphans_time:
+                cls.drop_partitions(now - cls.expiration_time)
+                cls.next_flush_orphans_time = now + cls.flush_orphans_interval
+        elif settings.STATS_SIMPLE_WIPE:
             "We also have a general flush added in for 2.2 which just clears everything old every so often!"
             now = datetime.now(utc)
             if now > cls.next_flush_orphans_time:
@@ -193,6 +470,119 @@ class Sample(models.Model):
             "Delete earliest points from multiple series."
             if ids:
                 cls.delete(id__in=ids, dt__lt=min(map(cls.start, ids)))
+        if cls.archived():
+            now = datetime.now(utc)
+            if now > cls.next_pack_time:
+                cls.pack(now - timedelta(seconds=cls.step * SampleArchive.POINTS))
+                SampleArchive.delete(step=cls.step, last__lt=now - cls.expiration_time)
+                cls.next_pack_time = now + timedelta(seconds=cls.step * SampleArchive.POINTS / SampleArchive.PACK_RATE)
+
+
+class SampleArchive(models.Model):
+    """Compressed points of a series from a Sample, one row per window of POINTS steps.
+    Points are packed by chroma_core.lib.stats_archive, and stored base64 encoded.
+    """
+    MIN_STEP = 3600  # only Samples at least this coarse are archived
+    POINTS = 240  # steps per archive window
+    PACK_RATE = 10  # packs per archive window
+    BATCH = 1000  # archives stored per query
+
+    id = models.IntegerField(primary_key=True)  # for django only, not really the primary key
+    step = models.IntegerField()
+    dt = models.DateTimeField()  # start of window
+    last = models.DateTimeField()
+    count = models.IntegerField()
+    data = models.TextField()
+
+    class Meta:
+        app_label = 'chroma_core'
+        unique_together = ('id', 'step', 'dt'),
+
+    def points(self):
+        "Return list of archived points."
+        data = base64.b64decode(self.data)
+        return [Point(epoch + timedelta(seconds=ts), sum, int(len)) for ts, sum, len in stats_archive.decode(data, self.step)]
+
+    @classmethod
+    def select(cls, step, ids, start=None, stop=None):
+        "Return mapping of series ids to archived points of a Sample, optionally within an interval."
+        query = cls.objects.filter(step=step, id__in=ids)
+        if start is not None:
+            query = query.filter(last__gte=start)
+        if stop is not None:
+            query = query.filter(dt__lt=stop)
+        points = collections.defaultdict(list)
+        for archive in query.order_by('id', 'dt').iterator():
+            points[archive.id] += (point for point in archive.points()
+                                   if (start is None or point.dt >= start) and (stop is None or point.dt < stop))
+        return points
+
+    @classmethod
+    def generate(cls, step, id, reverse=False, dt__gte=None, dt__lt=None):
+        "Generate archived points for a series, only querying when iterated."
+        points = cls.select(step, [id], dt__gte, dt__lt)[id]
+        for point in (reversed(points) if reverse else points):
+            yield point
+
+    @classmethod
+    def store(cls, step, archives):
+        "Store archives of (series id, window start datetime, points), merging points into existing archives."
+        if not archives:
+            return
+        keys = set((id, dt) for id, dt, points in archives)
+        query = cls.objects.filter(step=step, id__in=set(id for id, dt in keys), dt__in=set(dt for id, dt in keys))
+        existing = dict(((archive.id, archive.dt), archive) for archive in query if (archive.id, archive.dt) in keys)
+        rows, merged = [], []
+        for id, dt, points in archives:
+            if (id, dt) in existing:
+                points = sorted(dict((point.dt, point) for point in existing[id, dt].points() + points).values())
+                merged.append(models.Q(id=id, dt=dt))
+            data = stats_archive.encode([(timestamp(point.dt), point.sum, point.len) for point in points], step)
+            rows.append(cls(id, step, dt, points[-1].dt, len(points), base64.b64encode(data)))
+        if merged:
+            cls.delete(reduce(operator.or_, merged), step=step)
+        cls.objects.bulk_create(rows)
+
+    @classmethod
+    def delete(cls, *args, **filters):
+        "Delete archives in bulk."
+        query = cls.objects.filter(*args, **filters)
+        models.sql.DeleteQuery(cls).do_query(cls._meta.db_table, query.query.where, query.db)
+
+
+class LatestSample(models.Model):
+    """Snapshot of the most recent point of every series, maintained as stats are inserted.
+    Allows processes without warm caches to read latest points in bulk, without querying the Sample tables.
+    """
+    id = models.IntegerField(primary_key=True)  # series id
+    dt = models.DateTimeField()
+    sum = models.FloatField()
+    len = models.IntegerField()
+
+    class Meta:
+        app_label = 'chroma_core'
+
+    @classmethod
+    def update(cls, stats):
+        "Store the most recent point of each series in a mapping of series ids to points."
+        points = dict((id, max(stats[id])) for id in stats if stats[id])
+        if not points:
+            return
+        if connections[cls.objects.db].vendor == 'postgresql':
+            # single writer, so update existing rows and insert the rest without conflict
+            values = ', '.join(['(%s, %s::timestamptz, %s, %s)'] * len(points))
+            sql = 'UPDATE {0} SET dt = new.dt, sum = new.sum, len = new.len ' \
+                  'FROM (VALUES {1}) AS new (id, dt, sum, len) WHERE {0}.id = new.id RETURNING {0}.id'
+            cursor = connections[cls.objects.db].cursor()
+            cursor.execute(sql.format(cls._meta.db_table, values), [field for id in points for field in (id,) + points[id]])
+            for id, in cursor.fetchall():
+                del points[id]
+            cls.objects.bulk_create([cls(id, *points[id]) for id in points])
+            transaction.commit_unless_managed(using=cls.objects.db)
+        else:
+            for id in points:
+                if not cls.objects.filter(id=id).update(**points[id]._asdict()):
+                    cls.objects.create(id=id, **points[id]._asdict())
 
 
 class Stats(list):
@@ -205,23 +595,31 @@ class Stats(list):
                          'step': sample.sample_rate,
                          'expiration_time': sample.expiration_time,
                          'next_flush_orphans_time': epoch,
+                         'next_pack_time': epoch,
                          'flush_orphans_interval': sample.expiration_time / settings.STATS_FLUSH_RATE,
-                         'cache': cache}
+                         'partition_ranges': None,
+                         'cache': cache,
+                         'maxlen': maxlen,
+                         'buffer': cStringIO.StringIO()}
             self.append(type('Sample_{0:d}'.format(sample.sample_rate), (Sample,), namespace))
 
     def insert(self, samples):
         "Bulk insert new samples (id, dt, value).  Skip and return outdated samples."
-        # keep stats as Points grouped by id
-        outdated, stats = [], collections.defaultdict(list)
+        # keep stats as Points grouped by id, looking up the latest point once per series
+        outdated, stats, latest = [], collections.defaultdict(list), {}
         for id, dt, value in samples:
-            if dt > self[0].latest(id).dt:
+            if id not in latest:
+                latest[id] = self[0].latest(id).dt
+            if dt > latest[id]:
                 stats[id].append(Point(dt, value, 1))
             else:
                 outdated.append((id, dt, value))
-        # insert stats into first Sample and check the rest
+        # insert stats into first Sample and the snapshot of latest points, and check the rest
         self[0].insert(stats)
+        LatestSample.update(stats)
         for previous, model in zip(self, self[1:]):
             step = timedelta(seconds=model.step)
+            columns = Columns()
             for id in list(stats):
                 start = model.latest(id).dt + step
                 stop = model.floor(max(stats.pop(id)).dt)
@@ -232,9 +630,10 @@ class Stats(list):
                         points = (point for point in cache if start <= point.dt < stop and point.len)
                     else:
                         points = previous.select(id, dt__gte=start, dt__lt=stop)
-                    points = list(model.reduce(points))
-                    if points:
-                        stats[id] = points
+                    columns.extend(id, points)
+            # roll up all series for this Sample in a single batch
+            for id, points in columns.reduce(model.step).groups():
+                stats[id] = points
             previous.expire(stats)
             model.insert(stats)
         model.expire(stats)
@@ -251,12 +650,45 @@ class Stats(list):
             if start >= model.start(id) and model.step >= minstep:
                 break
         points = model.select(id, dt__gte=start, dt__lt=stop)
-        points = list(points if index else model.reduce(points))
+        return self.shape(index, points, start, stop, rate, fixed)
+
+    def select_many(self, ids, start, stop, rates=(), maxlen=float('inf'), fixed=0):
+        """Return mapping of series ids to points, equivalent to calling select for each series.
+        Series are grouped by the Sample they select from, with one range query per Sample used.
+        Rates are derived for series whose ids are in the given collection.
+        """
+        minstep = total_seconds(stop - start) / maxlen
+        groups, pending = {}, set(ids)
+        for index, model in enumerate(self):
+            if not pending:
+                break
+            if model is self[-1]:
+                groups[index] = pending
+            elif model.step >= minstep:
+                starts = model.starts(pending)
+                groups[index] = set(id for id in pending if start >= starts[id])
+                pending = pending.difference(groups[index])
+        result = {}
+        for index in groups:
+            points = collections.defaultdict(list)
+            if groups[index]:
+                if self[index].archived():
+                    points.update(SampleArchive.select(self[index].step, groups[index], start, stop))
+                query = self[index].objects.filter(id__in=groups[index], dt__gte=start, dt__lt=stop)
+                for row in query.order_by('id', 'dt').values_list('id', *Point._fields).iterator():
+                    points[row[0]].append(Point(*row[1:]))
+            for id in groups[index]:
+                result[id] = self.shape(index, points[id], start, stop, id in rates, fixed)
+        return result
+
+    def shape(self, index, points, start, stop, rate=False, fixed=0):
+        "Return selected points from the Sample at index, reduced and optionally derived and fixed as by select."
+        points = list(points if index else self[index].reduce(points))
         if rate:
             points = map(operator.sub, points[1:], points[:-1])
         if fixed:
             step = (stop - start) / fixed
-            intervals = [Point(start + step * index, 0.0, 0) for index in range(fixed)]
+            intervals = [Point(start + step * interval, 0.0, 0) for interval in range(fixed)]
             for point in points:
                 intervals[int(total_seconds(point.dt - start) / total_seconds(step))] += point
             points = intervals
@@ -267,15 +699,62 @@ class Stats(list):
         point = self[0].latest(id)
         return Point(self[0].floor(point.dt), point.sum, point.len)
 
+    def preload(self):
+        """Warm caches with the most recent points of all active series, with a single query per Sample.
+        Series are active if sampled within a cache length of the newest point in the Sample.
+        Return mapping of Sample names to number of series loaded.
+        """
+        loaded = {}
+        for model in self:
+            latest = model.objects.aggregate(latest=models.Max('dt'))['latest']
+            if latest is not None:
+                loaded[model.__name__] = model.preload(latest - timedelta(seconds=model.step * model.maxlen))
+        return loaded
+
+    def discard(self, ids):
+        """Drop cached points of series, and the cached partition tables, of each Sample model, and cached Series.
+        Used after rolling back an insert, which would leave them ahead of the database."""
+        Series.cache.clear()
+        for model in self:
+            for id in ids:
+                if id in model.cache:
+                    del model.cache[id]
+            model.partition_ranges = None
+
+    def cache_info(self):
+        "Return cache statistics for Series and each Sample model."
+        info = {'Series': Series.cache.info()}
+        for model in self:
+            info[model.__name__] = model.cache.info()
+        return info
+
+    def latest_many(self, ids):
+        "Return mapping of series ids to most recent data points, as from latest, read from the snapshot."
+        points = dict.fromkeys(ids, Point.zero)
+        for id, dt, sum, len in LatestSample.objects.filter(id__in=points).values_list('id', *Point._fields):
+            points[id] = Point(self[0].floor(dt), sum, len)
+        return points
+
+    def refresh_latest(self):
+        "Add series missing from the snapshot of latest points, from the first Sample.  Return number of series added."
+        query = self[0].objects.exclude(id__in=LatestSample.objects.values('id'))
+        rows = query.order_by('id', '-dt').distinct('id').values_list('id', *Point._fields)
+        LatestSample.objects.bulk_create(LatestSample(*row) for row in rows)
+        return len(rows)
+
     def delete(self, id):
         "Delete all stored points for a series."
         for model in self:
             model.delete(id=id)
+        SampleArchive.delete(id=id)
+        LatestSample.objects.filter(id=id).delete()
 
     def delete_all(self):
         "Delete all stored points for a series."
         for model in self:
             model.delete(id__gte=0)
+        SampleArchive.delete(id__gte=0)
+        LatestSample.objects.all().delete()
 
 
 Stats = Stats(SAMPLES)
@@ -87,7 +87,13 @@ class ServiceThread(threading.Thread):
             self.service.stop()
 
 
+# Transport for settings.SERVICE_TRANSPORT = 'local', in place of the AMQP broker
+LOCAL_TRANSPORT = 'chroma_core.services.local_transport:Transport'
+
+
 def _amqp_connection():
+    if getattr(settings, 'SERVICE_TRANSPORT', 'amqp') == 'local':
+        return BrokerConnection(transport = LOCAL_TRANSPORT)
     return BrokerConnection(settings.BROKER_URL)
 
 
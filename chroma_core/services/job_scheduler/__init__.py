@@ -39,32 +39,37 @@ class QueueHandler(object):
         # Disregard any old messages
         self._queue.serve(self.on_message)
 
-    def on_message(self, message):
-        try:
-            # Deserialize any datetimes which were serialized for JSON
-            deserialized_update_attrs = {}
-            model_klass = ContentType.objects.get_by_natural_key(*message['instance_natural_key']).model_class()
-            for attr, value in message['update_attrs'].items():
-                try:
-                    field = [f for f in model_klass._meta.fields if f.name == attr][0]
-                except IndexError:
-                    # e.g. _id names, they aren't datetimes so ignore them
-                    deserialized_update_attrs[attr] = value
+    def _deserialize(self, message):
+        # Deserialize any datetimes which were serialized for JSON
+        deserialized_update_attrs = {}
+        model_klass = ContentType.objects.get_by_natural_key(*message['instance_natural_key']).model_class()
+        for attr, value in message['update_attrs'].items():
+            try:
+                field = [f for f in model_klass._meta.fields if f.name == attr][0]
+            except IndexError:
+                # e.g. _id names, they aren't datetimes so ignore them
+                deserialized_update_attrs[attr] = value
+            else:
+                if isinstance(field, DateTimeField):
+                    deserialized_update_attrs[attr] = IMLDateTime.parse(value)
                 else:
-                    if isinstance(field, DateTimeField):
-                        deserialized_update_attrs[attr] = IMLDateTime.parse(value)
-                    else:
-                        deserialized_update_attrs[attr] = value
+                    deserialized_update_attrs[attr] = value
 
-            log.debug("on_message: %s %s" % (message, deserialized_update_attrs))
+        log.debug("on_message: %s %s" % (message, deserialized_update_attrs))
 
-            self._job_scheduler.notify(
-                message['instance_natural_key'],
+        return (message['instance_natural_key'],
                 message['instance_id'],
                 message['time'],
                 deserialized_update_attrs,
-                message['from_states']
-            )
+                message['from_states'])
+
+    def on_message(self, message):
+        try:
+            if isinstance(message, list):
+                # A batch of notifications coalesced by job_scheduler_notify
+                self._job_scheduler.notify_many([self._deserialize(m) for m in message])
+            else:
+                self._job_scheduler.notify(*self._deserialize(message))
         except:
             # Log bad messages and continue, swallow the exception to avoid
             # bringing down the whole service
@@ -113,24 +113,25 @@ class CommandPlan(object):
         # its dependencies and locks are in.
         assert transaction.is_managed()
 
-        for job in jobs:
-            for dependency in self._dep_cache.get(job).all():
-                if not dependency.satisfied():
-                    log.info("add_jobs: setting required dependency %s %s" % (dependency.stateful_object, dependency.preferred_state))
-                    self._set_state(dependency.get_stateful_object(), dependency.preferred_state, command)
-            log.info("add_jobs: done checking dependencies")
-            locks = self._create_locks(job)
-            job.locks_json = json.dumps([l.to_dict() for l in locks])
-            self._create_dependencies(job, locks)
-            with transaction.commit_on_success():
-                job.save()
-
-            log.info("add_jobs: created Job %s (%s)" % (job.pk, job.description()))
+        with self._lock_cache.batch():
+            for job in jobs:
+                for dependency in self._dep_cache.get(job).all():
+                    if not dependency.satisfied():
+                        log.info("add_jobs: setting required dependency %s %s" % (dependency.stateful_object, dependency.preferred_state))
+                        self._set_state(dependency.get_stateful_object(), dependency.preferred_state, command)
+                log.info("add_jobs: done checking dependencies")
+                locks = self._create_locks(job)
+                job.locks_json = json.dumps([l.to_dict() for l in locks])
+                self._create_dependencies(job, locks)
+                with transaction.commit_on_success():
+                    job.save()
+
+                log.info("add_jobs: created Job %s (%s)" % (job.pk, job.description()))
+
+                for l in locks:
+                    self._lock_cache.add(l)
 
-            for l in locks:
-                self._lock_cache.add(l)
-
-            command.jobs.add(job)
+                command.jobs.add(job)
 
         self._job_collection.add_command(command, jobs)
 
@@ -463,10 +464,11 @@ class CommandPlan(object):
     def command_set_state(self, object_ids, message, command=None):
         if not command:
             command = Command.objects.create(message=message)
-        for ct_nk, o_pk, state in object_ids:
-            model_klass = ContentType.objects.get_by_natural_key(*ct_nk).model_class()
-            instance = model_klass.objects.get(pk=o_pk)
-            self._set_state(instance, state, command)
+        with self._lock_cache.batch():
+            for ct_nk, o_pk, state in object_ids:
+                model_klass = ContentType.objects.get_by_natural_key(*ct_nk).model_class()
+                instance = model_klass.objects.get(pk=o_pk)
+                self._set_state(instance, state, command)
 
         log.info("Created command %s (%s) with %s jobs" % (command.id, command.message, command.jobs.count()))
         if command.jobs.count() == 0:
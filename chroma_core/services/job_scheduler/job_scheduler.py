@@ -15,7 +15,7 @@ import operator
 import itertools
 from collections import defaultdict
 import Queue
-from copy import deepcopy
+from copy import copy, deepcopy
 from chroma_core.lib.util import all_subclasses
 
 
@@ -364,9 +364,44 @@ class JobCollection(object):
         self._command_to_jobs = defaultdict(set)
         self._job_to_commands = defaultdict(set)
 
+        # Index of pending jobs by readiness: the number of jobs each is waiting for which
+        # are not yet complete, the pending jobs waiting for each job, and the pending jobs
+        # which are waiting for nothing.
+        self._unmet_counts = {}
+        self._waiters = defaultdict(set)
+        self._ready_jobs = {}
+
+    def _index(self, job, initial_state):
+        """Update the readiness index for `job` having moved from `initial_state` (None if it
+        is newly added) to its current state."""
+        if initial_state == 'pending':
+            # Entries in _waiters for a job which is no longer pending are skipped when read
+            self._unmet_counts.pop(job.id, None)
+            self._ready_jobs.pop(job.id, None)
+
+        if job.state == 'pending':
+            complete_jobs = self._state_jobs['complete']
+            unmet_ids = set(json.loads(job.wait_for_json)) - set(complete_jobs)
+            self._unmet_counts[job.id] = len(unmet_ids)
+            for wait_for_id in unmet_ids:
+                self._waiters[wait_for_id].add(job.id)
+            if not unmet_ids:
+                self._ready_jobs[job.id] = job
+        elif job.state == 'complete':
+            for waiter_id in self._waiters.pop(job.id, ()):
+                if waiter_id in self._unmet_counts:
+                    self._unmet_counts[waiter_id] -= 1
+                    if not self._unmet_counts[waiter_id]:
+                        self._ready_jobs[waiter_id] = self._jobs[waiter_id]
+
     def add(self, job):
+        existing = self._jobs.get(job.id)
         self._jobs[job.id] = job
         self._state_jobs[job.state][job.id] = job
+        if existing is None:
+            self._index(job, None)
+        elif job.id in self._ready_jobs:
+            self._ready_jobs[job.id] = job
 
     def add_command(self, command, jobs):
         """Add command if it doesn't already exist, and ensure that all
@@ -397,6 +432,7 @@ class JobCollection(object):
             log.warning("Cancelling uncached Job %s" % job.id)
         else:
             self._state_jobs[job.state][job.id] = job
+            self._index(job, initial_state)
 
     def update_commands(self, job):
         """
@@ -418,20 +454,17 @@ class JobCollection(object):
 
     def update_many(self, jobs, new_state):
         for job in jobs:
+            initial_state = job.state
             del self._state_jobs[job.state][job.id]
             job.state = new_state
             self._state_jobs[job.state][job.id] = job
+            self._index(job, initial_state)
 
         Job.objects.filter(id__in = [j.id for j in jobs]).update(state = new_state)
 
     @property
     def ready_jobs(self):
-        result = []
-        for job in self._state_jobs['pending'].values():
-            wait_for_ids = json.loads(job.wait_for_json)
-            complete_job_ids = [j.id for j in self._state_jobs['complete'].values()]
-            if not set(wait_for_ids) - set(complete_job_ids):
-                result.append(job)
+        result = self._ready_jobs.values()
 
         if len(result) == 0 and len(self.pending_jobs) == 0 and len(self.tasked_jobs) == 0:
             # A quiescent state, flush the collection (avoid building up an indefinitely
@@ -475,6 +508,7 @@ class JobScheduler(object):
 
         self._db_quota = SimpleConnectionQuota(self.MAX_STEP_DB_CONNECTIONS)
         self._run_threads = {}  # Map of job ID to RunJobThread
+        self._advertised_jobs_by_class = {}  # Map of model class to the AdvertisedJob classes for it
 
         self.progress = JobProgress(self)
 
@@ -783,6 +817,8 @@ class JobScheduler(object):
         # fresh instance of everything we update (this is safe because earlier we checked that nothing is
         # locking this object.
         instance = ObjectCache.update(instance)
+        if instance is not None:
+            self._lock_cache.publish_states([instance])
 
         # FIXME: should check the new state against reverse dependencies
         # and apply any fix_states
@@ -796,6 +832,37 @@ class JobScheduler(object):
 
             self._run_next()
 
+    @transaction.commit_on_success
+    def notify_many(self, notifications):
+        """Apply a batch of notifications, each a tuple of the arguments to `notify`, under one
+        acquisition of the lock and in one transaction.  A notification which fails is logged
+        and skipped, so it doesn't prevent the rest of the batch being applied: its changes
+        are rolled back to a savepoint, and the object it was applied to is reloaded into
+        ObjectCache.
+        """
+        with self._lock:
+            for content_type, object_id, time_serialized, update_attrs, from_states in notifications:
+                savepoint = transaction.savepoint()
+                try:
+                    notification_time = IMLDateTime.parse(time_serialized)
+                    self._notify(content_type, object_id, notification_time, update_attrs, from_states)
+                except Exception:
+                    log.warning("notify_many: failed to apply notification for %s/%s: %s" % (content_type, object_id, traceback.format_exc()))
+                    transaction.savepoint_rollback(savepoint)
+
+                    model_klass = ContentType.objects.get_by_natural_key(*content_type).model_class()
+                    try:
+                        instance = ObjectCache.update(ObjectCache.get_by_id(model_klass, object_id))
+                    except model_klass.DoesNotExist:
+                        pass
+                    else:
+                        if instance is not None:
+                            self._lock_cache.publish_states([instance])
+                else:
+                    transaction.savepoint_commit(savepoint)
+
+            self._run_next()
+
     @transaction.commit_on_success
     def run_jobs(self, job_dicts, message):
         with self._lock:
@@ -894,6 +961,7 @@ class JobScheduler(object):
 
                 log.info("Job %d: complete_job: Updating cache" % job.pk)
                 # Freshen cached information about anything that this job held a writelock on
+                updated_items, purged_items = [], []
                 for lock in self._lock_cache.get_by_job(job):
                     if lock.write:
                         if hasattr(lock.locked_item, 'not_deleted'):
@@ -908,6 +976,7 @@ class JobScheduler(object):
                             log.debug("Job %d: purging %s/%s" %
                                       (job.id, lock.locked_item.__class__, lock.locked_item.id))
                             ObjectCache.purge(lock.locked_item.__class__, lambda o: o.id == lock.locked_item.id)
+                            purged_items.append(lock.locked_item)
                         else:
                             log.debug("Job %d: updating write-locked %s/%s" %
                                       (job.id, lock.locked_item.__class__, lock.locked_item.id))
@@ -918,7 +987,12 @@ class JobScheduler(object):
                                 lock.locked_item.__class__.objects.filter(pk=lock.locked_item.pk).update(
                                     state_modified_at=django.utils.timezone.now())
 
-                            ObjectCache.update(lock.locked_item)
+                            updated_item = ObjectCache.update(lock.locked_item)
+                            if updated_item is not None and hasattr(updated_item, 'state'):
+                                updated_items.append(updated_item)
+
+                # Published while still write locked, so queries never see the old state unlocked
+                self._lock_cache.publish_states(updated_items, purged_items)
 
                 if job.state != 'tasked':
                     # This happens if a Job is cancelled while it's calling this
@@ -1348,6 +1422,46 @@ class JobScheduler(object):
 
         return stateful_object.downcast()
 
+    @staticmethod
+    def _retrieve_stateful_objects(object_list, from_db = False):
+        """Get the stateful objects in object_list, resolving the model of each natural key once.
+
+        Return dict of (natural key tuple, id) to object for those which exist.  With `from_db`
+        each model's objects are loaded from the DB in one query, otherwise from the cache.
+        """
+        ids_by_key = defaultdict(list)
+        for obj_key, obj_id in object_list:
+            ids_by_key[tuple(obj_key)].append(obj_id)
+
+        stateful_objects = {}
+        for obj_key, obj_ids in ids_by_key.items():
+            model_klass = ContentType.objects.get_by_natural_key(*obj_key).model_class()
+            if from_db:
+                for obj_id, stateful_object in model_klass.objects.in_bulk(obj_ids).items():
+                    stateful_objects[(obj_key, obj_id)] = stateful_object
+            else:
+                cache_klass = ManagedTarget if issubclass(model_klass, ManagedTarget) else model_klass
+                for obj_id in obj_ids:
+                    try:
+                        stateful_objects[(obj_key, obj_id)] = ObjectCache.get_by_id(cache_klass, obj_id).downcast()
+                    except ObjectDoesNotExist:
+                        pass
+
+        return stateful_objects
+
+    def _snapshot_stateful_objects(self, object_list, from_db = False):
+        """Return the current lock snapshot, and copies of the stateful objects in object_list
+        (see _retrieve_stateful_objects) with the states published in the snapshot.  The locks
+        and states are then consistent with each other, even while the scheduler changes them."""
+        stateful_objects = JobScheduler._retrieve_stateful_objects(object_list, from_db)
+        lock_snapshot = self._lock_cache.snapshot
+        for key, stateful_object in stateful_objects.items():
+            if not from_db:
+                # Cached instances are the scheduler's, and may be changed while they're read
+                stateful_object = stateful_objects[key] = copy(stateful_object)
+            stateful_object.state = lock_snapshot.state(stateful_object, stateful_object.state)
+        return lock_snapshot, stateful_objects
+
     def available_transitions(self, object_list):
         """Compute the available transitional states for each stateful object
 
@@ -1363,47 +1477,45 @@ class JobScheduler(object):
         :return: dict of list of states {obj_id: ['<state1>','<state2',etc], }
         """
 
-        with self._lock:
-            transitions = defaultdict(list)
-            for obj_key, obj_id in object_list:
-                try:
-                    # Hit the DB for the statefulobject (ManagedMgs, ManagedMdt, etc., avoiding all caches
-                    # Localize fixed for HYD-2714.  May chance again as HYD-3155 is resolved.
-                    model_klass = ContentType.objects.get_by_natural_key(*obj_key).model_class()
-                    stateful_object = model_klass.objects.get(pk=obj_id)
-
-                    # Used to leverage the ObjectCache, but this suspect now:  HYD-3155
-                    # stateful_object = JobScheduler._retrieve_stateful_object(obj_key, obj_id)
-
-                    log.debug("available_transitions object: %s, state: %s" % (stateful_object, stateful_object.state))
-                except ObjectDoesNotExist:
-                    # Do not advertise transitions for an object that does not exist
-                    # as can happen if a parallel operation deletes this object
+        # Hit the DB for the statefulobjects (ManagedMgs, ManagedMdt, etc., avoiding all caches
+        # Localize fixed for HYD-2714.  May chance again as HYD-3155 is resolved.
+        # Used to leverage the ObjectCache, but this suspect now:  HYD-3155
+        # Read only: answered from the lock snapshot, without taking the scheduler lock.
+        lock_snapshot, stateful_objects = self._snapshot_stateful_objects(object_list, from_db = True)
+
+        transitions = defaultdict(list)
+        for obj_key, obj_id in object_list:
+            stateful_object = stateful_objects.get((tuple(obj_key), obj_id))
+            if stateful_object is None:
+                # Do not advertise transitions for an object that does not exist
+                # as can happen if a parallel operation deletes this object
+                transitions[obj_id] = []
+                log.debug("available_transitions object: %s" % obj_id)
+            else:
+                log.debug("available_transitions object: %s, state: %s" % (stateful_object, stateful_object.state))
+
+                # We don't advertise transitions for anything which is currently
+                # locked by an incomplete job.  We could alternatively advertise
+                # which jobs would actually be legal to add by skipping this
+                # check and using get_expected_state in place of .state below.
+                if lock_snapshot.is_write_locked(stateful_object):
                     transitions[obj_id] = []
-                    log.debug("available_transitions object: %s" % obj_id)
+                    log.debug("available_transitions object is LOCKED: %s" % obj_id)
                 else:
-                    # We don't advertise transitions for anything which is currently
-                    # locked by an incomplete job.  We could alternatively advertise
-                    # which jobs would actually be legal to add by skipping this
-                    # check and using get_expected_state in place of .state below.
-                    if self._lock_cache.get_latest_write(stateful_object):
-                        transitions[obj_id] = []
-                        log.debug("available_transitions object is LOCKED: %s" % obj_id)
-                    else:
-                        # XXX: could alternatively use expected_state here if you
-                        # want to advertise
-                        # what jobs can really be added (i.e. advertise transitions
-                        # which will
-                        # be available when current jobs are complete)
-                        #  See method self.get_expected_state(stateful_object)
-                        from_state = stateful_object.state
-                        available_states = stateful_object.get_available_states(from_state)
-                        log.debug("available_transitions from_state: %s, states: %s" % (from_state, available_states))
+                    # XXX: could alternatively use expected_state here if you
+                    # want to advertise
+                    # what jobs can really be added (i.e. advertise transitions
+                    # which will
+                    # be available when current jobs are complete)
+                    #  See method self.get_expected_state(stateful_object)
+                    from_state = stateful_object.state
+                    available_states = stateful_object.get_available_states(from_state)
+                    log.debug("available_transitions from_state: %s, states: %s" % (from_state, available_states))
+
+                    # Add the job verbs to the possible state transitions for displaying as a choice.
+                    transitions[obj_id] = self._add_verbs(stateful_object, available_states)
 
-                        # Add the job verbs to the possible state transitions for displaying as a choice.
-                        transitions[obj_id] = self._add_verbs(stateful_object, available_states)
-
-            return transitions
+        return transitions
 
     def _add_verbs(self, stateful_object, raw_transitions):
         """Lookup the verb for each available state
@@ -1438,27 +1550,39 @@ class JobScheduler(object):
 
         return transitions
 
-    def _fetch_jobs(self, stateful_object):
-        from chroma_core.models import AdvertisedJob
+    def _advertised_job_classes(self, klass):
+        """Return the (non plural) AdvertisedJob classes which apply to instances of klass,
+        resolving each job's class names only the first time klass is seen."""
+        try:
+            return self._advertised_jobs_by_class[klass]
+        except KeyError:
+            from chroma_core.models import AdvertisedJob
+
+            job_classes = []
+            for job_class in all_subclasses(AdvertisedJob):
+                if not job_class.plural:
+                    for class_name in job_class.classes:
+                        ct = ContentType.objects.get_by_natural_key(
+                            'chroma_core', class_name.lower())
+                        if issubclass(klass, ct.model_class()):
+                            job_classes.append(job_class)
+
+            self._advertised_jobs_by_class[klass] = job_classes
+            return job_classes
 
+    def _fetch_jobs(self, stateful_object):
         available_jobs = []
-        for job_class in all_subclasses(AdvertisedJob):
-            if not job_class.plural:
-                for class_name in job_class.classes:
-                    ct = ContentType.objects.get_by_natural_key(
-                        'chroma_core', class_name.lower())
-                    klass = ct.model_class()
-                    if isinstance(stateful_object, klass):
-                        if job_class.can_run(stateful_object):
-                            available_jobs.append({
-                                'verb': job_class.verb,
-                                'long_description': job_class.long_description(stateful_object),
-                                'display_group': job_class.display_group,
-                                'display_order': job_class.display_order,
-                                'confirmation': job_class.get_confirmation(
-                                    stateful_object),
-                                'class_name': job_class.__name__,
-                                'args': job_class.get_args(stateful_object)})
+        for job_class in self._advertised_job_classes(type(stateful_object)):
+            if job_class.can_run(stateful_object):
+                available_jobs.append({
+                    'verb': job_class.verb,
+                    'long_description': job_class.long_description(stateful_object),
+                    'display_group': job_class.display_group,
+                    'display_order': job_class.display_order,
+                    'confirmation': job_class.get_confirmation(
+                        stateful_object),
+                    'class_name': job_class.__name__,
+                    'args': job_class.get_args(stateful_object)})
         return available_jobs
 
     def available_jobs(self, object_list):
@@ -1476,35 +1600,36 @@ class JobScheduler(object):
                         'confirmation': ..., 'class_name': ..., 'args: ...}], ...}
         """
 
-        with self._lock:
+        # Read only: answered from the lock snapshot, without taking the scheduler lock.
+        lock_snapshot, stateful_objects = self._snapshot_stateful_objects(object_list)
 
-            jobs = defaultdict(list)
-            for obj_key, obj_id in object_list:
+        jobs = defaultdict(list)
+        for obj_key, obj_id in object_list:
 
-                try:
-                    stateful_object = JobScheduler._retrieve_stateful_object(obj_key, obj_id)
-                except ObjectDoesNotExist:
-                    # Do not advertise jobs for an object that does not exist
-                    # as can happen if a parallel operation deletes this object
+            stateful_object = stateful_objects.get((tuple(obj_key), obj_id))
+            if stateful_object is None:
+                # Do not advertise jobs for an object that does not exist
+                # as can happen if a parallel operation deletes this object
+                jobs[obj_id] = []
+            else:
+                # If the object is subject to an incomplete Job
+                # then don't offer any actions
+                if lock_snapshot.is_write_locked(stateful_object):
                     jobs[obj_id] = []
                 else:
-                    # If the object is subject to an incomplete Job
-                    # then don't offer any actions
-                    if self._lock_cache.get_latest_write(stateful_object) > 0:
-                        jobs[obj_id] = []
-                    else:
-                        jobs[obj_id] = self._fetch_jobs(stateful_object)
+                    jobs[obj_id] = self._fetch_jobs(stateful_object)
 
-            return jobs
+        return jobs
 
     def get_locks(self, obj_key, obj_id):
         locks = {'read': [],
                  'write': []}
 
+        lock_snapshot = self._lock_cache.snapshot
         try:
             object = JobScheduler._retrieve_stateful_object(obj_key, obj_id)
-            locks['read'] = list(set([x.job.id for x in self._lock_cache.read_by_item[object]]))
-            locks['write'] = list(set([x.job.id for x in self._lock_cache.write_by_item[object]]))
+            locks['read'] = list(lock_snapshot.read_job_ids(object))
+            locks['write'] = list(lock_snapshot.write_job_ids(object))
         except ObjectDoesNotExist:
             pass
 
@@ -266,3 +266,10 @@ class JobSchedulerClient(object):
     @classmethod
     def get_locks(cls, obj_key, obj_id):
         return JobSchedulerRpc().get_locks(obj_key, obj_id)
+
+    @classmethod
+    def get_locks_many(cls, objects):
+        """Return list of locks, as from get_locks, for a list of (obj_key, obj_id), with a single RPC."""
+        with JobSchedulerRpc().batch() as batch:
+            futures = [batch.get_locks(obj_key, obj_id) for obj_key, obj_id in objects]
+        return [future.result() for future in futures]
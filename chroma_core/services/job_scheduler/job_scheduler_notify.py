@@ -9,8 +9,14 @@ The RPCs are used for explicit requests to modify the system or run a particular
 is used for updates received from agent reports.  Access to both of these, along with some additional
 non-remote functionality is wrapped in JobSchedulerClient.
 
+Notifications made within a `coalesce` block are merged per object and sent together as a
+single message, which the job scheduler applies under one lock and one transaction.
+
 """
 import datetime
+import threading
+import contextlib
+import collections
 
 from django.contrib.contenttypes.models import ContentType
 from django.db.models import DateTimeField
@@ -27,6 +33,51 @@ class NotificationQueue(ServiceQueue):
     name = 'job_scheduler_notifications'
 
 
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def coalesce():
+    """Within this context, notifications from the current thread are held back, and sent as
+    a single message on leaving the outermost context.
+
+    Notifications for the same object with the same from_states are merged into one, and where
+    they update the same attribute, the value from the latest notification wins.
+    """
+    if getattr(_local, 'pending', None) is not None:
+        yield
+        return
+
+    _local.pending = collections.OrderedDict()
+    try:
+        yield
+    finally:
+        pending, _local.pending = _local.pending, None
+        if pending:
+            messages = [dict(message, time = message['time'].isoformat()) for message in pending.values()]
+            log.info("Sending %s coalesced notifications" % len(messages))
+            NotificationQueue().put(messages)
+
+
+def _enqueue(message):
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        NotificationQueue().put(dict(message, time = message['time'].isoformat()))
+        return
+
+    key = (message['instance_natural_key'], message['instance_id'], tuple(message['from_states']))
+    try:
+        existing = pending[key]
+    except KeyError:
+        pending[key] = message
+    else:
+        if message['time'] >= existing['time']:
+            existing['update_attrs'].update(message['update_attrs'])
+            existing['time'] = message['time']
+        else:
+            existing['update_attrs'] = dict(message['update_attrs'], **existing['update_attrs'])
+
+
 def notify(instance, time, update_attrs, from_states = []):
     """Having detected that the state of an object in the database does not
     match information from real life (i.e. chroma-agent), call this to
@@ -68,11 +119,10 @@ def notify(instance, time, update_attrs, from_states = []):
                 else:
                     encoded_attrs[attr] = value
 
-        time_serialized = time.isoformat()
-        NotificationQueue().put({
+        _enqueue({
             'instance_natural_key': ContentType.objects.get_for_model(instance).natural_key(),
             'instance_id': instance.id,
-            'time': time_serialized,
+            'time': time,
             'update_attrs': encoded_attrs,
             'from_states': from_states
         })
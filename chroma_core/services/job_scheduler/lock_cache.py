@@ -4,10 +4,85 @@
 
 
 from collections import defaultdict
+from contextlib import contextmanager
+import bisect
 import json
 from django.db.models import Q
 
 
+class LocksByJob(object):
+    """The locks held on a single item, ordered by job ID (and by when they were added,
+    among locks of the same job), so that the latest and those after a given job are
+    found by bisection rather than by sorting or scanning all of them.
+
+    """
+
+    def __init__(self):
+        self._job_ids = []
+        self._locks = []
+
+    def add(self, lock):
+        # Locks are almost always added for the newest job, so append rather than insert when possible
+        if not self._job_ids or lock.job.id >= self._job_ids[-1]:
+            self._job_ids.append(lock.job.id)
+            self._locks.append(lock)
+        else:
+            index = bisect.bisect_right(self._job_ids, lock.job.id)
+            self._job_ids.insert(index, lock.job.id)
+            self._locks.insert(index, lock)
+
+    def remove(self, lock):
+        index = bisect.bisect_left(self._job_ids, lock.job.id)
+        while self._locks[index] is not lock:
+            index += 1
+        del self._job_ids[index]
+        del self._locks[index]
+
+    def latest(self, not_job = None):
+        for lock in reversed(self._locks):
+            if not_job is None or lock.job != not_job:
+                return lock
+        return None
+
+    def after(self, job_id):
+        "Return locks of jobs with IDs from job_id onwards."
+        return self._locks[bisect.bisect_left(self._job_ids, job_id):]
+
+    def __iter__(self):
+        return iter(self._locks)
+
+    def __len__(self):
+        return len(self._locks)
+
+
+class LockSnapshot(object):
+    """Immutable view of the locks held at one version of a LockCache, for answering
+    queries without taking the scheduler lock.  Maps each locked item to the sorted
+    IDs of the jobs holding read and write locks on it, and each object whose state
+    the scheduler has changed to that state, so that the two are read consistently.
+
+    """
+
+    def __init__(self, version = 0, read_by_item = None, write_by_item = None, state_by_item = None):
+        self.version = version
+        self._read_by_item = read_by_item or {}
+        self._write_by_item = write_by_item or {}
+        self._state_by_item = state_by_item or {}
+
+    def read_job_ids(self, locked_item):
+        return self._read_by_item.get(locked_item, ())
+
+    def write_job_ids(self, locked_item):
+        return self._write_by_item.get(locked_item, ())
+
+    def is_write_locked(self, locked_item):
+        return locked_item in self._write_by_item
+
+    def state(self, item, default = None):
+        "Return the state of item as published by the scheduler, or default if it hasn't published one."
+        return self._state_by_item.get(item, default)
+
+
 class LockCache(object):
 
     # Lock change receivers are called whenever a change occurs to the locks. It allows something to
@@ -20,26 +95,36 @@ class LockCache(object):
     def __init__(self):
         from chroma_core.models import Job, StateLock
 
-        self.write_locks = []
-        self.write_by_item = defaultdict(list)
-        self.read_locks = []
-        self.read_by_item = defaultdict(list)
+        self.write_locks = set()
+        self.write_by_item = defaultdict(LocksByJob)
+        self.read_locks = set()
+        self.read_by_item = defaultdict(LocksByJob)
         self.all_by_job = defaultdict(list)
-        self.all_by_item = defaultdict(list)
+        self.all_by_item = defaultdict(LocksByJob)
+
+        # Replaced (never modified) after each change, so that it may be read from any thread
+        self.snapshot = LockSnapshot()
+
+        # Locks added within batch(), not yet published
+        self._batch_depth = 0
+        self._batched_locks = []
 
+        locks = []
         for job in Job.objects.filter(~Q(state = 'complete')):
             if job.locks_json:
-                locks = json.loads(job.locks_json)
-                for lock in locks:
-                    self._add(StateLock.from_dict(job, lock))
+                for lock in json.loads(job.locks_json):
+                    locks.append(StateLock.from_dict(job, lock))
+                    self._add(locks[-1])
+        self._publish([lock.locked_item for lock in locks])
+        for lock in locks:
+            self.call_receivers(lock, self.LOCK_ADD)
 
     def call_receivers(self, lock, add_remove):
         for lock_change_receiver in self.lock_change_receivers:
             lock_change_receiver(lock, add_remove)
 
     def remove_job(self, job):
-        locks = list(self.all_by_job[job.id])
-        n = len(locks)
+        locks = self.all_by_job.pop(job.id, [])
         for lock in locks:
             if lock.write:
                 self.write_locks.remove(lock)
@@ -47,27 +132,81 @@ class LockCache(object):
             else:
                 self.read_locks.remove(lock)
                 self.read_by_item[lock.locked_item].remove(lock)
-            self.all_by_job[job.id].remove(lock)
             self.all_by_item[lock.locked_item].remove(lock)
+        self._publish([lock.locked_item for lock in locks])
+        for lock in locks:
             self.call_receivers(lock, self.LOCK_REMOVE)
-        return n
+        return len(locks)
 
     def add(self, lock):
         self._add(lock)
+        if self._batch_depth:
+            self._batched_locks.append(lock)
+        else:
+            self._publish([lock.locked_item])
+            self.call_receivers(lock, self.LOCK_ADD)
+
+    @contextmanager
+    def batch(self):
+        """Publish the locks added within the block (which may be nested) once at the end,
+        rather than copying the snapshot for each of them, and call the receivers then."""
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                locks, self._batched_locks = self._batched_locks, []
+                self._publish([lock.locked_item for lock in locks])
+                for lock in locks:
+                    self.call_receivers(lock, self.LOCK_ADD)
+
+    def _publish(self, locked_items):
+        """Replace the snapshot with one in which the locks on locked_items are updated.
+        Only the changed items are recomputed; the rest are shared with the previous one."""
+        if not locked_items:
+            return
+
+        read_by_item = dict(self.snapshot._read_by_item)
+        write_by_item = dict(self.snapshot._write_by_item)
+        for locked_item in set(locked_items):
+            for by_item, locks in (read_by_item, self.read_by_item), (write_by_item, self.write_by_item):
+                job_ids = tuple(sorted(set(lock.job.id for lock in locks[locked_item])))
+                if job_ids:
+                    by_item[locked_item] = job_ids
+                else:
+                    by_item.pop(locked_item, None)
+
+        self.snapshot = LockSnapshot(self.snapshot.version + 1, read_by_item, write_by_item, self.snapshot._state_by_item)
+
+    def publish_states(self, items, removed = ()):
+        """Replace the snapshot with one in which the states of items are updated, and those
+        of removed items are dropped.  Call when the scheduler changes the state of objects,
+        before releasing any locks on them."""
+        if not items and not removed:
+            return
+
+        state_by_item = dict(self.snapshot._state_by_item)
+        for item in items:
+            state_by_item[item] = item.state
+        for item in removed:
+            state_by_item.pop(item, None)
+
+        snapshot = self.snapshot
+        self.snapshot = LockSnapshot(snapshot.version + 1, snapshot._read_by_item, snapshot._write_by_item, state_by_item)
 
     def _add(self, lock):
         assert lock.job.id is not None
 
         if lock.write:
-            self.write_locks.append(lock)
-            self.write_by_item[lock.locked_item].append(lock)
+            self.write_locks.add(lock)
+            self.write_by_item[lock.locked_item].add(lock)
         else:
-            self.read_locks.append(lock)
-            self.read_by_item[lock.locked_item].append(lock)
+            self.read_locks.add(lock)
+            self.read_by_item[lock.locked_item].add(lock)
 
         self.all_by_job[lock.job.id].append(lock)
-        self.all_by_item[lock.locked_item].append(lock)
-        self.call_receivers(lock, self.LOCK_ADD)
+        self.all_by_item[lock.locked_item].add(lock)
 
     def get_by_job(self, job):
         return self.all_by_job[job.id]
@@ -76,16 +215,10 @@ class LockCache(object):
         return self.all_by_item[locked_item]
 
     def get_latest_write(self, locked_item, not_job = None):
-        try:
-            if not_job != None:
-                return sorted([l for l in self.write_by_item[locked_item] if l.job != not_job], lambda a, b: cmp(a.job.id, b.job.id))[-1]
-            else:
-                return sorted(self.write_by_item[locked_item], lambda a, b: cmp(a.job.id, b.job.id))[-1]
-        except IndexError:
-            return None
+        return self.write_by_item[locked_item].latest(not_job)
 
     def get_read_locks(self, locked_item, after, not_job):
-        return [x for x in self.read_by_item[locked_item] if after <= x.job.id and x.job != not_job]
+        return [x for x in self.read_by_item[locked_item].after(after) if x.job != not_job]
 
     def get_write(self, locked_item):
         return self.write_by_item[locked_item]
@@ -97,7 +230,7 @@ class LockCache(object):
         result = {}
         for locked_item, locks in self.write_by_item.items():
             if locks:
-                result[locked_item] = sorted(locks, lambda a, b: cmp(a.job.id, b.job.id))[-1]
+                result[locked_item] = locks.latest()
         return result
 
 
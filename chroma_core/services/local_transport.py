@@ -0,0 +1,369 @@
+# Copyright (c) 2018 DDN. All rights reserved.
+# Use of this source code is governed by a MIT-style
+# license that can be found in the LICENSE file.
+
+
+"""Kombu transport between services on the same node, without a broker.
+
+Selected by setting SERVICE_TRANSPORT to 'local' for every service on the node (see
+`chroma_core.services._amqp_connection`), so ServiceQueue and the RPC module use it
+unchanged.
+
+Each queue is held by the process consuming it, which listens on a Unix domain socket
+named after the queue in settings.LOCAL_TRANSPORT_PATH.  Publishers connect to that
+socket and write length prefixed messages, marshalled rather than encoded as JSON.
+Every queue and exchange in IML is bound by a routing key equal to the queue name, so
+messages are routed by routing key alone, and bindings need not be shared between
+processes.
+
+As with the transient queues on the AMQP broker, messages waiting in a queue are lost
+if the consuming process exits.  Messages for a queue whose consumer hasn't started (or
+is restarting) are held by the publishing process, and sent in order once it can connect
+to the queue's socket, retrying every RETRY_INTERVAL seconds, so publishing never waits
+for the consumer.  Where AMQP would drop messages for a queue which no longer exists,
+held messages are dropped after HOLD_TIMEOUT seconds (RESPONSE_HOLD_TIMEOUT for the
+response queues of RPC clients, which go with the client), or once MAX_BACKLOG are held.
+"""
+
+
+import os
+import errno
+import time
+import socket
+import struct
+import marshal
+import threading
+import Queue
+from collections import deque
+
+from kombu.transport import virtual
+
+from chroma_core.services.log import log_register
+
+import settings
+
+
+log = log_register('local_transport')
+
+# How long to wait before retrying to send messages held for a queue without a consumer
+RETRY_INTERVAL = 0.1
+
+# How long to hold messages for a queue without a consumer before dropping them
+HOLD_TIMEOUT = 300
+RESPONSE_HOLD_TIMEOUT = 10
+
+# How many messages to hold for a queue without a consumer
+MAX_BACKLOG = 10000
+
+# How long a connection to a queue may go unused before it is closed
+IDLE_TIMEOUT = 60
+
+# How long to wait before accepting again after accept fails
+ACCEPT_BACKOFF = 0.1
+
+# messages are prefixed by their length as a 4 byte unsigned int
+HEADER = struct.Struct('>I')
+
+_listeners = {}
+_senders = {}
+_lock = threading.Lock()
+_next_sweep = 0
+
+
+def _path(queue):
+    return os.path.join(settings.LOCAL_TRANSPORT_PATH, "%s.sock" % queue)
+
+
+class Listener(threading.Thread):
+    """Accept connections on the socket of a queue consumed by this process, and read
+    messages from them into the queue."""
+
+    def __init__(self, queue):
+        super(Listener, self).__init__(name = "local_transport-%s" % queue)
+        # Don't hold up exit of processes which consume queues without calling shutdown()
+        self.daemon = True
+        self.path = _path(queue)
+        self.messages = Queue.Queue()
+        self._connections = set()
+        self._stopping = False
+
+        try:
+            os.makedirs(os.path.dirname(self.path), 0700)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.bind(self.path)
+        except socket.error, e:
+            if e.errno != errno.EADDRINUSE:
+                raise
+            # Left behind by a process which exited, unless it's still being listened on
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except socket.error:
+                os.unlink(self.path)
+                self._socket.bind(self.path)
+            else:
+                raise RuntimeError("Queue '%s' is already consumed by another process" % queue)
+            finally:
+                probe.close()
+        self._socket.listen(128)
+
+    def run(self):
+        while not self._stopping:
+            try:
+                connection, _ = self._socket.accept()
+            except socket.error, e:
+                if self._stopping or e.errno == errno.EBADF:
+                    break
+                log.warning("Error accepting connection on %s: %r" % (self.path, e))
+                time.sleep(ACCEPT_BACKOFF)
+                continue
+            with _lock:
+                self._connections.add(connection)
+            reader = threading.Thread(target = self._read, args = (connection,), name = "%s-reader" % self.name)
+            reader.daemon = True
+            reader.start()
+
+    def _read(self, connection):
+        stream = connection.makefile('rb')
+        try:
+            while True:
+                header = stream.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                self.messages.put(marshal.loads(stream.read(HEADER.unpack(header)[0])))
+        except (socket.error, EOFError, ValueError), e:
+            log.warning("Dropped connection to %s: %r" % (self.path, e))
+        finally:
+            stream.close()
+            connection.close()
+            with _lock:
+                self._connections.discard(connection)
+
+    def stop(self):
+        self._stopping = True
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        # Shutting down wakes threads blocked in accept and recv, where closing would not
+        with _lock:
+            connections = list(self._connections)
+        for sock in [self._socket] + connections:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        self._socket.close()
+
+
+class Sender(object):
+    """Connection to the socket of a queue, shared by the threads publishing to it.  Messages
+    which can't be sent yet are held, in order, and retried from a timer thread until they
+    expire."""
+
+    def __init__(self, queue):
+        self.path = _path(queue)
+        self.hold_timeout = RESPONSE_HOLD_TIMEOUT if 'responses_' in queue else HOLD_TIMEOUT
+        self.last_used = time.time()
+        self._socket = None
+        self._backlog = deque()
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def send(self, data):
+        with self._lock:
+            self.last_used = time.time()
+            if len(self._backlog) >= MAX_BACKLOG:
+                log.warning("Dropped message for %s, already holding %s" % (self.path, len(self._backlog)))
+                return
+            self._backlog.append((self.last_used + self.hold_timeout, HEADER.pack(len(data)) + data))
+            if self._timer is None:
+                self._flush()
+
+    def _flush(self):
+        "Send the held messages, or schedule a retry if the consumer can't be reached.  Call holding _lock."
+        # Reconnect once, in case the consumer has restarted since the last message
+        reconnected = False
+        while self._backlog:
+            if self._socket is None:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                try:
+                    sock.connect(self.path)
+                except socket.error, e:
+                    sock.close()
+                    if e.errno not in (errno.ENOENT, errno.ECONNREFUSED):
+                        log.warning("Error connecting to %s: %r" % (self.path, e))
+                    break
+                self._socket = sock
+            try:
+                self._socket.sendall(self._backlog[0][1])
+            except socket.error:
+                self._socket.close()
+                self._socket = None
+                if reconnected:
+                    break
+                reconnected = True
+            else:
+                self._backlog.popleft()
+
+        now = time.time()
+        expired = 0
+        while self._backlog and self._backlog[0][0] < now:
+            self._backlog.popleft()
+            expired += 1
+        if expired:
+            log.warning("Dropped %s messages held for %s with no consumer" % (expired, self.path))
+
+        if self._backlog:
+            self._timer = threading.Timer(RETRY_INTERVAL, self._retry)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _retry(self):
+        with self._lock:
+            self._timer = None
+            self._flush()
+
+    def close_if_idle(self, now):
+        "Close the connection and return True if nothing is held or has been sent for IDLE_TIMEOUT."
+        with self._lock:
+            if self._backlog or now - self.last_used < IDLE_TIMEOUT:
+                return False
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+            return True
+
+    def stop(self):
+        "Stop retrying, dropping any messages held."
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._backlog.clear()
+
+
+def listen(queue):
+    "Start receiving messages for queue in this process, if not already."
+    with _lock:
+        if queue not in _listeners:
+            listener = _listeners[queue] = Listener(queue)
+            listener.start()
+        return _listeners[queue]
+
+
+def unlisten(queue):
+    "Stop receiving messages for queue, dropping any not yet delivered."
+    with _lock:
+        listener = _listeners.pop(queue, None)
+    if listener:
+        listener.stop()
+        listener.join()
+
+
+def send(queue, message):
+    global _next_sweep
+    with _lock:
+        # Forget queues not sent to lately, such as the response queues of finished RPC clients
+        now = time.time()
+        if now > _next_sweep:
+            _next_sweep = now + IDLE_TIMEOUT
+            for idle_queue in [name for name, sender in _senders.items() if sender.close_if_idle(now)]:
+                del _senders[idle_queue]
+
+        try:
+            sender = _senders[queue]
+        except KeyError:
+            sender = _senders[queue] = Sender(queue)
+    sender.send(marshal.dumps(message))
+
+
+def shutdown():
+    "Stop all listeners and retries, so that no threads are left running."
+    for queue in _listeners.keys():
+        unlisten(queue)
+    with _lock:
+        senders = _senders.values()
+    for sender in senders:
+        sender.stop()
+
+
+class Channel(virtual.Channel):
+    # Bodies are sent as they are, rather than base64 encoded for the sake of JSON
+    body_encoding = None
+
+    # How long to wait for a message on each poll of a consumed queue
+    get_timeout = 0.1
+
+    _auto_delete = set()
+
+    def _lookup(self, exchange, routing_key, default = None):
+        return [routing_key]
+
+    def _new_queue(self, queue, **kwargs):
+        pass
+
+    def _has_queue(self, queue, **kwargs):
+        return True
+
+    def _get(self, queue, timeout = None):
+        listener = _listeners.get(queue)
+        if listener is None:
+            raise Queue.Empty()
+        return listener.messages.get(timeout = self.get_timeout)
+
+    def _put(self, queue, message, **kwargs):
+        send(queue, message)
+
+    def _size(self, queue):
+        listener = _listeners.get(queue)
+        return listener.messages.qsize() if listener else 0
+
+    def _purge(self, queue):
+        listener = _listeners.get(queue)
+        count = 0
+        while listener:
+            try:
+                listener.messages.get_nowait()
+            except Queue.Empty:
+                break
+            count += 1
+        return count
+
+    def _delete(self, queue, *args, **kwargs):
+        unlisten(queue)
+
+    def queue_declare(self, queue = None, passive = False, **kwargs):
+        if kwargs.get('auto_delete'):
+            self._auto_delete.add(queue)
+        return super(Channel, self).queue_declare(queue, passive, **kwargs)
+
+    def basic_consume(self, queue, *args, **kwargs):
+        listen(queue)
+        return super(Channel, self).basic_consume(queue, *args, **kwargs)
+
+    def basic_cancel(self, consumer_tag):
+        queue = self._tag_to_queue.get(consumer_tag)
+        result = super(Channel, self).basic_cancel(consumer_tag)
+        if queue in self._auto_delete:
+            self._auto_delete.discard(queue)
+            unlisten(queue)
+        return result
+
+
+class Transport(virtual.Transport):
+    Channel = Channel
+
+    state = virtual.BrokerState()
+
+    # Channel._get blocks briefly instead
+    polling_interval = 0
+
+    driver_type = driver_name = 'iml-local'
+
+    connection_errors = virtual.Transport.connection_errors + (socket.error,)
@@ -9,6 +9,7 @@ from chroma_core.services.lustre_audit.update_scan import UpdateScan
 from chroma_core.models import ManagedHost
 from chroma_core.services import ChromaService, log_register
 from chroma_core.services.queue import AgentRxQueue
+from chroma_core.services.job_scheduler import job_scheduler_notify
 from django.db import transaction
 
 
@@ -25,17 +26,25 @@ class Service(ChromaService):
     def run(self):
         super(Service, self).run()
 
-        self._queue.serve(data_callback = self.on_data)
+        self._queue.serve_many(self.on_data_many)
 
     def on_data(self, fqdn, data):
+        self.on_data_many([(fqdn, data)])
+
+    def on_data_many(self, messages):
         with transaction.commit_manually():
             transaction.commit()
 
-        try:
-            host = ManagedHost.objects.get(fqdn = fqdn)
-            UpdateScan().run(host.id, data)
-        except Exception:
-            log.error("Error handling lustre message: %s", '\n'.join(traceback.format_exception(*(sys.exc_info()))))
+        hosts = dict(ManagedHost.objects.filter(fqdn__in = set(fqdn for fqdn, data in messages)).values_list('fqdn', 'id'))
+        # Send the job scheduler one message of notifications for the whole batch
+        with job_scheduler_notify.coalesce():
+            for fqdn, data in messages:
+                try:
+                    if fqdn not in hosts:
+                        raise ManagedHost.DoesNotExist("No host %s" % fqdn)
+                    UpdateScan().run(hosts[fqdn], data)
+                except Exception:
+                    log.error("Error handling lustre message: %s", '\n'.join(traceback.format_exception(*(sys.exc_info()))))
 
     def stop(self):
         super(Service, self).stop()
@@ -7,9 +7,15 @@
 around an AMQP queue."""
 
 
+import time
 import threading
+import collections
 
-from chroma_core.services import _amqp_connection
+from kombu.common import maybe_declare
+from kombu.entity import Exchange, Queue
+from kombu.pools import producers
+
+from chroma_core.services import _amqp_connection, serializers
 from chroma_core.services.log import log_register
 
 
@@ -33,14 +39,47 @@ class ServiceQueue(object):
 
         AcmeQueue().put({'foo': 'bar'})
 
+    Messages are published through kombu's per-process producer pool, so connections and
+    channels are reused between calls, and the queue is only declared once per connection.
     """
     name = None
 
+    # Counts by queue name of messages published, reconnection attempts, and total and maximum
+    # publish latency in seconds.  The lock is never held while waiting on the broker.
+    _stats = collections.defaultdict(lambda: {'publishes': 0, 'reconnects': 0, 'latency': 0.0, 'max_latency': 0.0})
+    _stats_lock = threading.Lock()
+
+    def _queue(self):
+        "Return queue as declared by a SimpleQueue of the same name."
+        exchange = Exchange(self.name, type = 'direct', durable = False)
+        return Queue(self.name, exchange, routing_key = self.name, durable = False)
+
+    def _count_reconnect(self, exc, interval):
+        log.warning("Reconnecting to publish to '%s' queue in %ss: %r" % (self.name, interval, exc))
+        with self._stats_lock:
+            self._stats[self.name]['reconnects'] += 1
+
     def put(self, body):
-        with _amqp_connection() as conn:
-            q = conn.SimpleQueue(self.name, serializer = 'json',
-                                 exchange_opts={'durable': False}, queue_opts={'durable': False})
-            q.put(body)
+        started = time.time()
+        retry_policy = {'max_retries': 10, 'errback': self._count_reconnect}
+        queue = self._queue()
+        with producers[_amqp_connection()].acquire(block = True) as producer:
+            maybe_declare(queue, producer.channel, True, **retry_policy)
+            producer.publish(body, serializer = serializers.preferred(), exchange = queue.exchange, routing_key = self.name,
+                             retry = True, retry_policy = retry_policy)
+        elapsed = time.time() - started
+        with self._stats_lock:
+            stats = self._stats[self.name]
+            stats['publishes'] += 1
+            stats['latency'] += elapsed
+            stats['max_latency'] = max(stats['max_latency'], elapsed)
+
+    @classmethod
+    def publish_stats(cls):
+        "Return mapping of queue names to counts of publishes and reconnects, and mean and maximum latency."
+        with cls._stats_lock:
+            return dict((name, dict(stats, latency = stats['latency'] / (stats['publishes'] or 1)))
+                        for name, stats in cls._stats.items())
 
     def purge(self):
         with _amqp_connection() as conn:
@@ -71,6 +110,32 @@ class ServiceQueue(object):
                 except QueueEmpty:
                     pass
 
+    def serve_many(self, callback_many, batch_size = 100, drain_timeout = 0.01, prefetch_count = None):
+        """Call back with lists of up to `batch_size` decoded messages: those waiting when the
+        first arrives, taken until none arrives within `drain_timeout` seconds or the batch is
+        full.  Up to `prefetch_count` (by default `batch_size`) messages are delivered ahead of
+        acknowledgement, and a batch is only acknowledged once the callback returns, so an
+        exception leaves it to be redelivered.
+        """
+        from Queue import Empty as QueueEmpty
+        with _amqp_connection() as conn:
+            q = conn.SimpleQueue(self.name, serializer = 'json',
+                                 exchange_opts={'durable': False}, queue_opts={'durable': False})
+            q.consumer.qos(prefetch_count = prefetch_count or batch_size)
+            while not self._stopping.is_set():
+                try:
+                    messages = [q.get(timeout = 1)]
+                except QueueEmpty:
+                    continue
+                while len(messages) < batch_size:
+                    try:
+                        messages.append(q.get(timeout = drain_timeout))
+                    except QueueEmpty:
+                        break
+                callback_many([message.decode() for message in messages])
+                for message in messages:
+                    message.ack()
+
 
 class AgentRxQueue(ServiceQueue):
     def __route_message(self, message):
@@ -104,3 +169,12 @@ class AgentRxQueue(ServiceQueue):
         self.__session_callback = session_callback
 
         return ServiceQueue.serve(self, self.__route_message)
+
+    def serve_many(self, data_callback_many, **kwargs):
+        """Data callback will receive lists of (fqdn, body) from batches of DATA messages,
+        as batched by ServiceQueue.serve_many.  Other messages are dropped.
+        """
+        def route_messages(messages):
+            data_callback_many([(message['fqdn'], message['body']) for message in messages if message['type'] == 'DATA'])
+
+        return ServiceQueue.serve_many(self, route_messages, **kwargs)
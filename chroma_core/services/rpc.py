@@ -22,6 +22,10 @@ import django
 import errno
 import os
 import time
+import heapq
+import contextlib
+import collections
+import Queue as queue
 import jsonschema
 
 from django.db import transaction
@@ -33,7 +37,7 @@ from kombu.messaging import Queue, Producer
 from kombu.entity import TRANSIENT_DELIVERY_MODE
 
 from chroma_core.services.log import log_register
-from chroma_core.services import _amqp_connection, _amqp_exchange
+from chroma_core.services import _amqp_connection, _amqp_exchange, serializers
 
 
 REQUEST_SCHEMA = {
@@ -44,6 +48,7 @@ REQUEST_SCHEMA = {
         'args': {'type': 'array', 'required': True},
         'kwargs': {'type': 'object', 'required': True},
         'response_routing_key': {'type': 'string', 'required': True},
+        'response_serializers': {'type': 'array'},
     }
 }
 
@@ -57,6 +62,10 @@ RESPONSE_SCHEMA = {
     }
 }
 
+# Validators are built once, rather than for each message by jsonschema.validate
+REQUEST_VALIDATOR = jsonschema.Draft3Validator(REQUEST_SCHEMA)
+RESPONSE_VALIDATOR = jsonschema.Draft3Validator(RESPONSE_SCHEMA)
+
 RESPONSE_TIMEOUT = 300
 
 """
@@ -69,6 +78,36 @@ LIGHTWEIGHT_CONNECTIONS_LIMIT = 10
 
 RESPONSE_CONN_LIMIT = 10
 
+"""
+Max number of RPCs that a service runs concurrently, in addition to those of
+PRIORITY_METHODS.  RPCs beyond this wait for a worker thread, up to RPC_BACKLOG,
+after which the service stops consuming requests and they are held by the broker,
+up to RPC_PREFETCH having been delivered.
+
+"""
+RPC_WORKERS = 75
+RPC_BACKLOG = 100
+RPC_PREFETCH = 100
+
+"""
+RPCs which don't hit the database, and may block for long periods, run in a separate
+lane of workers so that they neither wait for, nor hold up, other RPCs.
+
+The priority lane is unbounded, as each RPC in it waits for as long as the caller
+asks: submitting to it never blocks the thread consuming requests.  Its threads exit
+after being idle for RPC_PRIORITY_IDLE_TIMEOUT seconds.
+
+"""
+PRIORITY_METHODS = frozenset(['wait_table_change'])
+RPC_PRIORITY_IDLE_TIMEOUT = 60
+
+"""
+Method name of a request carrying a list of [method, args, kwargs] calls, made with
+ServiceRpcInterface.batch, whose result is the list of their results.
+
+"""
+BATCH_METHOD = '_batch'
+
 tx_connections = None
 rx_connections = None
 lw_connections = None
@@ -91,38 +130,23 @@ class RpcTimeout(Exception):
     pass
 
 
-class RunOneRpc(threading.Thread):
-    """Handle a single incoming RPC in a new thread, and send the
-    response (result or exception) from the execution thread."""
-
-    _outstanding = 0
-    _throttle_limit = 75
-    _throttled_locks = []
+class RunOneRpc(object):
+    """Handle a single incoming RPC on a worker thread, and send the
+    response (result or exception) from that thread."""
 
     def __init__(self, rpc, body, response_conn_pool):
-        super(RunOneRpc, self).__init__()
         self.rpc = rpc
         self.body = body
         self._response_conn_pool = response_conn_pool
 
     def run(self):
-        # We do not throttle rpcs that do not hit the database.
-        rpc_throttle = self.body['method'] not in ['wait_table_change']
-
         try:
-            if rpc_throttle:
-                if RunOneRpc._outstanding > RunOneRpc._throttle_limit:
-                    rpc_complete_event = threading.Event()
-                    RunOneRpc._throttled_locks.append(rpc_complete_event)
-                    log.info("_throttled_locks: '%s'" % RunOneRpc._throttled_locks)
-                    log.info("Throttled rpc to %s throttled rpcs=%s" % (self.body['method'], len(RunOneRpc._throttled_locks)))
-                    rpc_complete_event.wait()
-                    log.info("Released rpc to %s throttled rpcs=%s" % (self.body['method'], len(RunOneRpc._throttled_locks)))
-
-                RunOneRpc._outstanding += 1
-
+            if self.body['method'] == BATCH_METHOD:
+                call = self.rpc._local_call_many
+            else:
+                call = self.rpc._local_call
             result = {
-                'result': self.rpc._local_call(self.body['method'], *self.body['args'], **self.body['kwargs']),
+                'result': call(self.body['method'], *self.body['args'], **self.body['kwargs']),
                 'request_id': self.body['request_id'],
                 'exception': None
             }
@@ -149,16 +173,7 @@ class RunOneRpc(threading.Thread):
             }
             log.error("RunOneRpc: exception calling %s: %s" % (self.body['method'], backtrace))
         finally:
-            try:
-                if rpc_throttle:
-                    try:
-                        rpc_complete_event = RunOneRpc._throttled_locks.pop(0)
-                        rpc_complete_event.set()
-                    except IndexError:
-                        pass
-                    RunOneRpc._outstanding -= 1
-            finally:
-                django.db.connection.close()
+            django.db.connection.close()
 
         with self._response_conn_pool[_amqp_connection()].acquire(block=True) as connection:
             def errback(exc, _):
@@ -174,16 +189,102 @@ class RunOneRpc(threading.Thread):
             with Producer(connection) as producer:
 
                 maybe_declare(_amqp_exchange(), producer.channel, True, **retry_policy)
-                producer.publish(result, serializer="json", routing_key=self.body['response_routing_key'],
+                # Old clients don't send response_serializers, and only accept JSON
+                serializer = serializers.negotiate(self.body.get('response_serializers'))
+                producer.publish(result, serializer=serializer, routing_key=self.body['response_routing_key'],
                                  delivery_mode=TRANSIENT_DELIVERY_MODE, retry=True, retry_policy=retry_policy, immedate=True, mandatory=True)
 
 
+class RpcWorkerPool(object):
+    """Pool of threads running RPCs.  Threads are started as they are needed, up to
+    `limit`, and then kept for later RPCs.  Submitting blocks while `backlog` RPCs are already
+    waiting for a thread.
+
+    With a `limit` of None the pool is unbounded: a thread is started whenever none is idle,
+    so submitting never blocks, and threads exit once idle for `idle_timeout` seconds."""
+
+    def __init__(self, name, limit, backlog, idle_timeout = None):
+        self.name = name
+        self.limit = limit
+        self.idle_timeout = idle_timeout
+        self._queue = queue.Queue(backlog if limit is not None else 0)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._idle = 0
+        self._calls = 0
+        self._wait_time = 0.0
+        self._service_time = 0.0
+        self._max_service_time = 0.0
+
+    def submit(self, fn):
+        self._queue.put((time.time(), fn))
+        with self._lock:
+            # Start a thread unless there are enough idle ones for the waiting RPCs, up to any limit
+            if self._idle < self._queue.qsize() and (self.limit is None or len(self._threads) < self.limit):
+                thread = threading.Thread(target = self._work, name = "%s-%s" % (self.name, len(self._threads)))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            with self._lock:
+                self._idle += 1
+            try:
+                item = self._queue.get(timeout = self.idle_timeout)
+                timed_out = False
+            except queue.Empty:
+                item, timed_out = None, True
+            with self._lock:
+                self._idle -= 1
+                # Having timed out, stay for any RPC submitted since, as its submitter counted us idle
+                if timed_out and self._queue.qsize():
+                    continue
+                if item is None:
+                    self._threads.remove(threading.current_thread())
+                    return
+
+            queued_at, fn = item
+            started_at = time.time()
+            try:
+                fn()
+            except Exception:
+                log.exception("RpcWorkerPool %s: unhandled exception" % self.name)
+            finally:
+                service_time = time.time() - started_at
+                with self._lock:
+                    self._calls += 1
+                    self._wait_time += started_at - queued_at
+                    self._service_time += service_time
+                    self._max_service_time = max(self._max_service_time, service_time)
+
+    def stop(self):
+        "Ask idle threads to exit.  Busy threads are daemonic, so never prevent the process exiting."
+        for thread in list(self._threads):
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+
+    def stats(self):
+        "Return dict of threads, idle threads, queue depth, calls, and mean wait and service times."
+        with self._lock:
+            calls = self._calls or 1
+            return {'threads': len(self._threads),
+                    'idle': self._idle,
+                    'queue_depth': self._queue.qsize(),
+                    'calls': self._calls,
+                    'mean_wait_time': self._wait_time / calls,
+                    'mean_service_time': self._service_time / calls,
+                    'max_service_time': self._max_service_time}
+
+
 class RpcServer(ConsumerMixin):
     def __init__(self, rpc, connection, service_name, serialize = False):
         """
         :param rpc: A ServiceRpcInterface instance
         :param serialize: If True, then process RPCs one after another in a single thread
-        rather than running a thread for each RPC.
+        rather than running them in a pool of worker threads.
         """
         super(RpcServer, self).__init__()
         self.serialize = serialize
@@ -192,47 +293,74 @@ class RpcServer(ConsumerMixin):
         self.queue_name = service_name
         self.request_routing_key = "%s.requests" % self.queue_name
         self._response_conn_pool = kombu.pools.Connections(limit = RESPONSE_CONN_LIMIT)
+        self._pools = {
+            'default': RpcWorkerPool("%s-rpc" % service_name, RPC_WORKERS, RPC_BACKLOG),
+            'priority': RpcWorkerPool("%s-rpc-priority" % service_name, None, None, RPC_PRIORITY_IDLE_TIMEOUT)
+        }
 
     def get_consumers(self, Consumer, channel):
-        return [Consumer(
+        consumer = Consumer(
             queues=[Queue(self.request_routing_key, _amqp_exchange(), routing_key=self.request_routing_key, durable=False)],
-            callbacks=[self.process_task])]
+            callbacks=[self.process_task])
+        # Requests delivered while we're blocked on a full backlog stay unacknowledged,
+        # so this limits how many the broker will deliver before holding the rest.
+        consumer.qos(prefetch_count = RPC_PREFETCH)
+        return [consumer]
 
     def process_task(self, body, message):
         message.ack()
 
         try:
-            jsonschema.validate(body, REQUEST_SCHEMA)
+            REQUEST_VALIDATOR.validate(body)
         except jsonschema.ValidationError as e:
             # Don't even try to send an exception response, because validation failure
             # breaks our faith in request_id and response_routing_key
             log.error("Invalid RPC body: %s" % e)
         else:
-            RunOneRpc(self.rpc, body, self._response_conn_pool).start()
+            rpc = RunOneRpc(self.rpc, body, self._response_conn_pool)
+            if self.serialize:
+                rpc.run()
+            else:
+                self._pools['priority' if body['method'] in PRIORITY_METHODS else 'default'].submit(rpc.run)
+
+    def stats(self):
+        "Return mapping of worker pool lanes to their stats."
+        return dict((lane, pool.stats()) for lane, pool in self._pools.items())
 
     def stop(self):
         self.should_stop = True
+        for pool in self._pools.values():
+            pool.stop()
 
 
 class ResponseWaitState(object):
     """State kept by for each outstanding RPC -- the response handler
     must first populate result, then set the `complete` event."""
-    def __init__(self, rpc_timeout):
+    def __init__(self, rpc_timeout, method = None):
         self.complete = threading.Event()
         self.timeout = False
         self.result = None
+        self.method = method
         self.timeout_at = time.time() + rpc_timeout
 
 
 class RpcClientResponseHandler(threading.Thread):
     """Handle responses for a particular named RPC service.
 
+    The state of a request is dropped once its response arrives or it times out, whether or
+    not its result is ever collected.  Timeouts are tracked in a heap of (timeout_at, request_id),
+    so that aging only looks at the requests which have expired.  Entries for completed requests
+    are left in the heap until they expire, or the heap is rebuilt when they outnumber the
+    outstanding requests.
     """
     def __init__(self, response_routing_key):
         super(RpcClientResponseHandler, self).__init__()
         self._stopping = False
         self._response_states = {}
-        self._response_routing_key = response_routing_key
+        self.response_routing_key = response_routing_key
+        self._deadlines = []
+        self._in_flight = collections.defaultdict(int)
+        self._lock = threading.Lock()
 
         self._started = threading.Event()
 
@@ -244,35 +372,59 @@ class RpcClientResponseHandler(threading.Thread):
         """
         self._started.wait()
 
-    def start_wait(self, request_id, rpc_timeout):
+    def start_wait(self, request_id, rpc_timeout, method = None):
+        "Start tracking a request, returning its ResponseWaitState."
         log.debug("start_wait %s" % request_id)
-        self._response_states[request_id] = ResponseWaitState(rpc_timeout)
-
-    def complete_wait(self, request_id):
-        log.debug("complete_wait %s" % request_id)
-        state = self._response_states[request_id]
-        state.complete.wait()
-        log.debug("complete_wait %s triggered" % request_id)
-
-        del self._response_states[request_id]
-
-        if state.timeout:
-            raise RpcTimeout()
+        state = ResponseWaitState(rpc_timeout, method)
+        with self._lock:
+            self._response_states[request_id] = state
+            self._in_flight[method] += 1
+            if len(self._deadlines) > 2 * len(self._response_states) + 100:
+                self._deadlines = [(s.timeout_at, r) for r, s in self._response_states.items()]
+                heapq.heapify(self._deadlines)
+            else:
+                heapq.heappush(self._deadlines, (state.timeout_at, request_id))
+        return state
+
+    def _finish(self, request_id):
+        "Stop tracking a request, returning its state, or None if it's not tracked.  Call holding _lock."
+        state = self._response_states.pop(request_id, None)
+        if state is not None:
+            self._in_flight[state.method] -= 1
+            if not self._in_flight[state.method]:
+                del self._in_flight[state.method]
+        return state
+
+    def complete(self, request_id, response):
+        "Complete a request with its response."
+        with self._lock:
+            state = self._finish(request_id)
+        if state is None:
+            log.debug("Unknown request ID %s" % request_id)
         else:
-            return state.result
+            state.result = response
+            state.complete.set()
+
+    def in_flight(self):
+        "Return mapping of method names to the number of calls awaiting responses."
+        with self._lock:
+            return dict(self._in_flight)
 
     def _age_response_states(self):
-        # FIXME: keep a sorted list by insertion time to avoid
-        # the need to check all the timeouts
         t = time.time()
-        for request_id, state in self._response_states.items():
-            if not state.complete.is_set() and t > state.timeout_at:
-                log.debug("Aged out RPC %s" % request_id)
-                state.timeout = True
-                state.complete.set()
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] < t:
+                timeout_at, request_id = heapq.heappop(self._deadlines)
+                state = self._finish(request_id)
+                if state is not None:
+                    log.debug("Aged out RPC %s" % request_id)
+                    state.timeout = True
+                    state.complete.set()
 
     def timeout_all(self):
-        for request_id, state in self._response_states.items():
+        with self._lock:
+            states = [self._finish(request_id) for request_id in self._response_states.keys()]
+        for state in states:
             state.timeout = True
             state.complete.set()
 
@@ -282,26 +434,20 @@ class RpcClientResponseHandler(threading.Thread):
         def callback(body, message):
             # log.debug(body)
             try:
-                jsonschema.validate(body, RESPONSE_SCHEMA)
+                RESPONSE_VALIDATOR.validate(body)
             except jsonschema.ValidationError as e:
                 log.debug("Malformed response: %s" % e)
             else:
-                try:
-                    state = self._response_states[body['request_id']]
-                except KeyError:
-                    log.debug("Unknown request ID %s" % body['request_id'])
-                else:
-                    state.result = body
-                    state.complete.set()
+                self.complete(body['request_id'], body)
             finally:
                 message.ack()
 
         with rx_connections[_amqp_connection()].acquire(block = True) as connection:
             # Prepare the response queue
             with connection.Consumer(
-                queues = [kombu.messaging.Queue(self._response_routing_key,
+                queues = [kombu.messaging.Queue(self.response_routing_key,
                           _amqp_exchange(),
-                          routing_key=self._response_routing_key,
+                          routing_key=self.response_routing_key,
                           auto_delete = True,
                           durable = False)],
                     callbacks = [callback]):
@@ -330,30 +476,24 @@ class RpcClientResponseHandler(threading.Thread):
 class RpcClient(object):
     """
     One instance of this is created for each named RPC service
-    that this process calls into.
+    that this process calls into.  Except in lightweight mode, the
+    responses to all of them are received by one shared response
+    handler, which routes them by request ID.
 
     """
-    def __init__(self, service_name, lightweight = False):
+    def __init__(self, service_name, lightweight = False, response_thread = None):
         self._service_name = service_name
         self._request_routing_key = "%s.requests" % self._service_name
         self._lightweight = lightweight
         if not self._lightweight:
-            self._response_routing_key = "%s.responses_%s_%s" % (self._service_name, os.uname()[1], os.getpid())
-            self.response_thread = RpcClientResponseHandler(self._response_routing_key)
-            self.response_thread.start()
-            self.response_thread.wait_for_start()
+            self.response_thread = response_thread
+            self._response_routing_key = response_thread.response_routing_key
 
-    def stop(self):
-        if not self._lightweight:
-            self.response_thread.stop()
-
-    def join(self):
+    def in_flight(self):
         if not self._lightweight:
-            self.response_thread.join()
-
-    def timeout_all(self):
-        if not self._lightweight:
-            self.response_thread.timeout_all()
+            return dict((method, count) for (service_name, method), count in self.response_thread.in_flight().items()
+                        if service_name == self._service_name)
+        return {}
 
     def _send(self, connection, request):
         """
@@ -362,6 +502,7 @@ class RpcClient(object):
         """
         log.debug("send %s" % request['request_id'])
         request['response_routing_key'] = self._response_routing_key
+        request['response_serializers'] = serializers.available()
 
         def errback(exc, _):
                 log.info('RabbitMQ rpc got a temporary error. May retry. Error: %r', exc, exc_info=1)
@@ -373,59 +514,71 @@ class RpcClient(object):
 
         with Producer(connection) as producer:
             maybe_declare(_amqp_exchange(), producer.channel, True, **retry_policy)
-            producer.publish(request, serializer="json", routing_key=self._request_routing_key,
+            producer.publish(request, serializer=serializers.preferred(), routing_key=self._request_routing_key,
                              delivery_mode=TRANSIENT_DELIVERY_MODE, retry=True, retry_policy=retry_policy)
 
+    def call_async(self, request, rpc_timeout = RESPONSE_TIMEOUT):
+        """Send a request, and return an RpcFuture for its response.  In lightweight
+        mode the call completes before returning."""
+        if self._lightweight:
+            future = RpcFuture(request['method'], request['request_id'])
+            future._set(self._call_lightweight(request, rpc_timeout))
+            return future
+
+        state = self.response_thread.start_wait(request['request_id'], rpc_timeout, (self._service_name, request['method']))
+        with tx_connections[_amqp_connection()].acquire(block = True) as connection:
+            self._send(connection, request)
+        return RpcResponseFuture(state, request['method'], request['request_id'])
+
     def call(self, request, rpc_timeout = RESPONSE_TIMEOUT):
+        "Send a request, and return the result of the call once its response arrives."
+        return self.call_async(request, rpc_timeout).result(rpc_timeout)
+
+    def _call_lightweight(self, request, rpc_timeout):
+        "Send a request on a connection and response queue of its own, and return the response."
         request_id = request['request_id']
 
-        if not self._lightweight:
-            self.response_thread.start_wait(request_id, rpc_timeout)
-            with tx_connections[_amqp_connection()].acquire(block = True) as connection:
+        self._response_routing_key = "%s.responses_%s_%s_%s" % (
+            self._service_name, os.uname()[1], os.getpid(), request_id)
+        self._complete = False
+
+        def callback(body, message):
+            # log.debug(body)
+            try:
+                RESPONSE_VALIDATOR.validate(body)
+            except jsonschema.ValidationError as e:
+                log.debug("Malformed response: %s" % e)
+            else:
+                self._result = body
+                self._complete = True
+            finally:
+                message.ack()
+
+        with lw_connections[_amqp_connection()].acquire(block = True) as connection:
+            with connection.Consumer(
+                queues = [kombu.messaging.Queue(self._response_routing_key,
+                          _amqp_exchange(),
+                          routing_key=self._response_routing_key,
+                          auto_delete = True, durable = False)],
+                    callbacks = [callback]):
+
                 self._send(connection, request)
-            return self.response_thread.complete_wait(request_id)
-        else:
-            self._response_routing_key = "%s.responses_%s_%s_%s" % (
-                self._service_name, os.uname()[1], os.getpid(), request_id)
-            self._complete = False
 
-            def callback(body, message):
-                # log.debug(body)
-                try:
-                    jsonschema.validate(body, RESPONSE_SCHEMA)
-                except jsonschema.ValidationError as e:
-                    log.debug("Malformed response: %s" % e)
-                else:
-                    self._result = body
-                    self._complete = True
-                finally:
-                    message.ack()
-
-            with lw_connections[_amqp_connection()].acquire(block = True) as connection:
-                with connection.Consumer(
-                    queues = [kombu.messaging.Queue(self._response_routing_key,
-                              _amqp_exchange(),
-                              routing_key=self._response_routing_key,
-                              auto_delete = True, durable = False)],
-                        callbacks = [callback]):
-
-                    self._send(connection, request)
-
-                    timeout_at = time.time() + rpc_timeout
-                    while not self._complete:
-                        try:
-                            connection.drain_events(timeout = 1)
-                        except socket.timeout:
-                            pass
-                        except IOError as e:
-                            #  See HYD-2551
-                            if e.errno != errno.EINTR:
-                                # if not [Errno 4] Interrupted system call
-                                raise
-                        if time.time() > timeout_at:
-                            raise RpcTimeout()
-
-                    return self._result
+                timeout_at = time.time() + rpc_timeout
+                while not self._complete:
+                    try:
+                        connection.drain_events(timeout = 1)
+                    except socket.timeout:
+                        pass
+                    except IOError as e:
+                        #  See HYD-2551
+                        if e.errno != errno.EINTR:
+                            # if not [Errno 4] Interrupted system call
+                            raise
+                    if time.time() > timeout_at:
+                        raise RpcTimeout()
+
+                return self._result
 
 
 class RpcClientFactory(object):
@@ -446,14 +599,16 @@ class RpcClientFactory(object):
     call.  This is for use in WSGI handlers performing comparatively rare
     operations (things that happen when a user clicks a button).
 
-    Threaded mode spawns a response handler thread for each named RPC
-    service that the calling process interacts with.  This reduces the number
-    of queues and connections to one per service rather than one per call.  This
-    is for use when issuing large numbers of concurrent RPCs, such as when
-    performing a 1-per-server set of calls between backend processes.
+    Threaded mode spawns a single response handler thread, consuming one
+    response queue on one connection, for all of the RPC services that the
+    calling process interacts with.  Responses are routed to callers by request ID.
+    This reduces the number of queues and connections to one per process rather
+    than one per call.  This is for use when issuing large numbers of concurrent
+    RPCs, such as when performing a 1-per-server set of calls between backend processes.
     """
 
     _instances = {}
+    _response_thread = None
     _factory_lock = None
     _available = True
 
@@ -481,7 +636,7 @@ class RpcClientFactory(object):
         global tx_connections
         global rx_connections
         tx_connections = kombu.pools.Connections(limit = 10)
-        rx_connections = kombu.pools.Connections(limit = 20)
+        rx_connections = kombu.pools.Connections(limit = 1)
 
     @classmethod
     def shutdown_threads(cls):
@@ -490,15 +645,21 @@ class RpcClientFactory(object):
         """
         assert not cls._lightweight
         with cls._factory_lock:
-            for instance in cls._instances.values():
-                instance.stop()
-            for instance in cls._instances.values():
-                instance.join()
-            for instance in cls._instances.values():
-                instance.timeout_all()
+            if cls._response_thread is not None:
+                cls._response_thread.stop()
+                cls._response_thread.join()
+                cls._response_thread.timeout_all()
 
             cls._available = False
 
+    @classmethod
+    def in_flight(cls):
+        """Return mapping of RPC service names to mappings of method names to the number of
+        calls from this process awaiting responses.  Only calls made in threaded mode are counted.
+
+        """
+        return dict((queue_name, instance.in_flight()) for queue_name, instance in cls._instances.items())
+
     @classmethod
     def get_client(cls, queue_name):
         # This is code to disable _lightweight threads. Because we are past FF I am not removing the
@@ -519,16 +680,125 @@ class RpcClientFactory(object):
                 if not cls._available:
                     raise RuntimeError("Attempted to acquire %s instance after shutdown" % cls.__name__)
 
+                if cls._response_thread is None:
+                    cls._response_thread = RpcClientResponseHandler("responses_%s_%s" % (os.uname()[1], os.getpid()))
+                    cls._response_thread.start()
+                    cls._response_thread.wait_for_start()
+
                 try:
                     instance = cls._instances[queue_name]
                 except KeyError:
                     log.debug("Instantiating RpcWaiter for %s" % queue_name)
-                    instance = RpcClient(queue_name)
+                    instance = RpcClient(queue_name, response_thread = cls._response_thread)
                     cls._instances[queue_name] = instance
 
             return instance
 
 
+class RpcFuture(object):
+    """Result of an RPC which is available once the call has completed."""
+
+    def __init__(self, fn_name = None, request_id = None):
+        self.fn_name = fn_name
+        self.request_id = request_id
+        self._complete = threading.Event()
+        self._response = None
+
+    def _set(self, response):
+        "Complete the call with its response, or None if it timed out."
+        self._response = response
+        self._complete.set()
+
+    def _wait(self, timeout):
+        return self._complete.wait(timeout)
+
+    def done(self):
+        return self._complete.is_set()
+
+    def result(self, timeout = None):
+        """Return the result of the call, waiting up to `timeout` seconds for it to complete.
+        Raise RpcError if the call raised an exception, or RpcTimeout if it is not yet complete
+        or timed out waiting for a response."""
+        if not self._wait(timeout) or self._response is None:
+            raise RpcTimeout()
+
+        result = self._response
+        if result['exception']:
+            log.error("ServiceRpcInterface._call: exception %s: %s \ttraceback: %s" % (result['exception'], result.get('exception_type'), result.get('traceback')))
+            raise RpcError(result['exception'], result.get('exception_type'), traceback=result.get('traceback'))
+
+        # NB: 'result' can be very large, and almost cripple the various logs where
+        # rpcs are run: http.log, job_scheduler.log, etc.
+        # If you want to see response result data from rpcs at the INFO level, consider writing
+        # log messages into the JobSchedulerClient calls.  Leaving this in for DEBUG.
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Completed rpc: %s, id: %s, result: %s" % (self.fn_name, self.request_id, result))
+
+        return result['result']
+
+
+class RpcResponseFuture(RpcFuture):
+    """Future for the response to a request, as received by an RpcClientResponseHandler."""
+
+    def __init__(self, state, fn_name, request_id):
+        super(RpcResponseFuture, self).__init__(fn_name, request_id)
+        self._state = state
+
+    def done(self):
+        return self._state.complete.is_set()
+
+    def _wait(self, timeout):
+        if not self._state.complete.wait(timeout):
+            return False
+        if not self._complete.is_set():
+            self._set(None if self._state.timeout else self._state.result)
+        return True
+
+
+def gather(futures, timeout = None, return_exceptions = False):
+    """Return list of the results of RpcFutures, waiting up to `timeout` seconds for them all.
+    If `return_exceptions` is set, RPC exceptions and timeouts are returned in place of results,
+    otherwise the first is raised."""
+    deadline = None if timeout is None else time.time() + timeout
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result(None if deadline is None else max(deadline - time.time(), 0)))
+        except (RpcError, RpcTimeout) as e:
+            if not return_exceptions:
+                raise
+            results.append(e)
+    return results
+
+
+class RpcBatch(object):
+    """Calls made on a batch are not sent until the batch is, together in a single request.
+    Each call returns an RpcFuture, which has its result once the batch has been sent."""
+
+    def __init__(self, rpc):
+        self._rpc = rpc
+        self._calls = []
+
+    def __getattr__(self, name):
+        if name in self._rpc.methods:
+            return lambda *args, **kwargs: self._add(name, args, kwargs)
+        else:
+            raise AttributeError(name)
+
+    def _add(self, fn_name, args, kwargs):
+        future = RpcFuture()
+        self._calls.append((fn_name, args, kwargs, future))
+        return future
+
+    def send(self, rpc_timeout = RESPONSE_TIMEOUT):
+        if self._calls:
+            calls, self._calls = self._calls, []
+            responses = self._rpc._call(BATCH_METHOD, [[fn_name, args, kwargs] for fn_name, args, kwargs, future in calls],
+                                        rpc_timeout = rpc_timeout)
+            for call, response in zip(calls, responses):
+                call[-1]._set(response)
+
+
 class ServiceRpcInterface(object):
     """Create a class inheriting from this to expose some methods of another
     class for RPC.  In your subclass, define the `methods` class attribute with a list
@@ -561,6 +831,15 @@ class ServiceRpcInterface(object):
 
         FooRpc().functionality()
 
+    To invoke it several times with a single request, which the server runs
+    sequentially in one handler:
+
+    ::
+
+        with FooRpc().batch() as batch:
+            futures = [batch.functionality() for _ in range(10)]
+        results = [future.result() for future in futures]
+
     """
 
     def __init__(self, wrapped = None):
@@ -580,6 +859,12 @@ class ServiceRpcInterface(object):
             raise AttributeError(name)
 
     def _call(self, fn_name, *args, **kwargs):
+        return self.call_async(fn_name, *args, **kwargs).result()
+
+    def call_async(self, fn_name, *args, **kwargs):
+        """Start a call of the named method, returning an RpcFuture for its result, so that
+        one thread may have many calls in flight.  Use `gather` to collect several results.
+        Calls whose results aren't collected are forgotten once they complete or time out."""
         with transaction.commit_manually():
             transaction.commit()
 
@@ -598,29 +883,14 @@ class ServiceRpcInterface(object):
 
         rpc_client = RpcClientFactory.get_client(self.__class__.__name__)
 
-        result = rpc_client.call(request, rpc_timeout)
+        return rpc_client.call_async(request, rpc_timeout)
 
-        if result['exception']:
-            log.error("ServiceRpcInterface._call: exception %s: %s \ttraceback: %s" % (result['exception'], result['exception_type'], result.get('traceback')))
-            raise RpcError(result['exception'], result.get('exception_type'), traceback=result.get('traceback'))
-        else:
-            # NB: 'result' can be very large, and almost cripple the various logs where
-            # rpcs are run: http.log, job_scheduler.log, etc.
-            # If you want to see response result data from rpcs at the INFO level, consider writing
-            # log messages into the JobSchedulerClient calls.  Leaving this in for DEBUG.
-
-            if log.getEffectiveLevel() is not logging.DEBUG:
-                # Truncate message
-                result100 = str(result)[:100]
-                if str(result) != result100:
-                    result100 += "..."
-                result_str = result100
-            else:
-                result_str = result
-
-            log.debug("Completed rpc: %s, id: %s, result: %s" % (fn_name, request_id, result_str))
-
-            return result['result']
+    @contextlib.contextmanager
+    def batch(self, rpc_timeout = RESPONSE_TIMEOUT):
+        """Collect calls made within the context, and send them in one request when it exits."""
+        batch = RpcBatch(self)
+        yield batch
+        batch.send(rpc_timeout)
 
     def _local_call(self, fn_name, *args, **kwargs):
         log.debug("_local_call: %s %s %s" % (fn_name, args, kwargs))
@@ -628,6 +898,24 @@ class ServiceRpcInterface(object):
         fn = getattr(self.wrapped, fn_name)
         return fn(*args, **kwargs)
 
+    def _local_call_many(self, fn_name, calls):
+        """Run a batch of [method, args, kwargs] calls in order, returning a list of
+        responses, each with the result or exception of its call."""
+        assert fn_name == BATCH_METHOD
+        responses = []
+        for call_fn_name, args, kwargs in calls:
+            try:
+                responses.append({'result': self._local_call(call_fn_name, *args, **kwargs), 'exception': None})
+            except Exception as e:
+                import sys
+                import traceback
+                log.error("_local_call_many: exception calling %s: %s" % (call_fn_name, traceback.format_exc()))
+                responses.append({'result': None,
+                                  'exception': str(e),
+                                  'exception_type': type(e).__name__,
+                                  'traceback': '\n'.join(traceback.format_exception(*sys.exc_info()))})
+        return responses
+
     def run(self):
         with _amqp_connection() as connection:
             self.worker = RpcServer(self, connection, self.__class__.__name__)
@@ -636,4 +924,5 @@ class ServiceRpcInterface(object):
     def stop(self):
         # self.worker could be None if thread stopped before run() gets to the point of setting it
         if self.worker is not None:
+            log.info("RPC worker stats for %s: %s" % (self.__class__.__name__, self.worker.stats()))
             self.worker.stop()
@@ -0,0 +1,82 @@
+# Copyright (c) 2018 DDN. All rights reserved.
+# Use of this source code is governed by a MIT-style
+# license that can be found in the LICENSE file.
+
+
+"""Serializers for messages between services.
+
+JSON is always available.  If msgpack is installed, a compact binary serializer is
+registered with kombu as 'iml-msgpack', which also carries datetimes natively.
+
+Consumers decode either, according to the content type of each message.  Producers
+use settings.SERVICE_SERIALIZER, which should only be set to 'iml-msgpack' once every
+process in a deployment has msgpack; until then JSON keeps mixed versions working.
+RPC responses are always encoded with a serializer the caller says it accepts.
+"""
+
+
+import struct
+import datetime
+
+from django.utils.timezone import utc
+from kombu.serialization import register
+
+import settings
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+JSON = 'json'
+MSGPACK = 'iml-msgpack'
+
+DATETIME_EXT = 1
+epoch = datetime.datetime(1970, 1, 1)
+
+
+def _default(obj):
+    if isinstance(obj, datetime.datetime):
+        aware = obj.tzinfo is not None
+        delta = (obj.astimezone(utc).replace(tzinfo = None) if aware else obj) - epoch
+        return msgpack.ExtType(DATETIME_EXT, struct.pack('>qi?', delta.days * 86400 + delta.seconds, delta.microseconds, aware))
+    raise TypeError("Cannot serialize %r" % obj)
+
+
+def _ext_hook(code, data):
+    if code == DATETIME_EXT:
+        seconds, microseconds, aware = struct.unpack('>qi?', data)
+        dt = epoch + datetime.timedelta(seconds = seconds, microseconds = microseconds)
+        return dt.replace(tzinfo = utc) if aware else dt
+    return msgpack.ExtType(code, data)
+
+
+def dumps(obj):
+    # str is text here, so is packed as msgpack str rather than bin, as it is by default from msgpack 1.0
+    return msgpack.packb(obj, default = _default, use_bin_type = False)
+
+
+def loads(data):
+    # strings decode to unicode, as they do from JSON
+    return msgpack.unpackb(data, ext_hook = _ext_hook, raw = False)
+
+
+if msgpack:
+    register(MSGPACK, dumps, loads, content_type = 'application/x-iml-msgpack', content_encoding = 'binary')
+
+
+def available():
+    "Return list of serializer names which this process can decode, most preferred first."
+    return [MSGPACK, JSON] if msgpack else [JSON]
+
+
+def preferred():
+    "Return name of the serializer to send messages with."
+    serializer = getattr(settings, 'SERVICE_SERIALIZER', JSON)
+    return serializer if serializer in available() else JSON
+
+
+def negotiate(accepted):
+    "Return name of the first of the accepted serializers which is available, falling back to JSON."
+    return next((serializer for serializer in accepted or [] if serializer in available()), JSON)
@@ -3,11 +3,13 @@
 # license that can be found in the LICENSE file.
 
 
+import datetime
 import traceback
 from django import db
 from django.utils import dateparse
 from chroma_core.models import Stats
-from chroma_core.services import ChromaService, log_register, queue
+from chroma_core.lib.metrics import FilesystemAggregator
+from chroma_core.services import ChromaService, log_register, queue, serializers
 
 
 log = log_register(__name__)
@@ -17,30 +19,67 @@ class StatsQueue(queue.ServiceQueue):
     name = 'stats'
 
     def put(self, samples):
-        queue.ServiceQueue.put(self, [(id, str(dt), value) for id, dt, value in samples])
+        if serializers.preferred() == serializers.MSGPACK:
+            # datetimes are serialized natively
+            queue.ServiceQueue.put(self, list(samples))
+        else:
+            queue.ServiceQueue.put(self, [(id, str(dt), value) for id, dt, value in samples])
 
 
 class Service(ChromaService):
     def run(self):
         super(Service, self).run()
 
+        self.aggregator = FilesystemAggregator()
         self.queue = StatsQueue()
         self.queue.purge()
-        self.queue.serve(callback=self.insert)
+        log.info("Preloaded stats caches: {0}".format(Stats.preload()))
+        log.info("Added {0} series to the latest sample snapshot".format(Stats.refresh_latest()))
+        self.queue.serve_many(self.insert_many)
+
+    def insert_many(self, messages):
+        """Insert the samples of a batch of messages together.  If that fails, insert those of
+        each message in turn, so that one bad message doesn't lose the rest of the batch."""
+        try:
+            self._insert([sample for samples in messages for sample in samples])
+        except:
+            log.warn("Error handling batched stats insert, inserting {0} messages singly: {1}".format(len(messages), traceback.format_exc()))
+            for samples in messages:
+                self.insert(samples)
 
     def insert(self, samples):
         try:
-            outdated = Stats.insert((id, dateparse.parse_datetime(dt), value) for id, dt, value in samples)
+            self._insert(samples)
         except db.IntegrityError:
             log.error("Duplicate stats insert: " + db.connection.queries[-1]['sql'])
             db.transaction.rollback()  # allow future stats to still work
         except:
             log.error("Error handling stats insert: " + traceback.format_exc())
-        else:
-            if outdated:
-                log.warn("Outdated samples ignored: {0}".format(outdated))
+
+    def _insert(self, samples):
+        """Insert samples and their filesystem aggregates into every Sample tier in a single transaction,
+        so that a failure leaves nothing written and the samples may be retried."""
+        samples = [(id, dt if isinstance(dt, datetime.datetime) else dateparse.parse_datetime(dt), value)
+                   for id, dt, value in samples]
+        try:
+            with db.transaction.commit_on_success():
+                outdated = Stats.insert(samples)
+                ignored = set(outdated)
+                # the aggregator only emits aggregates newer than its last, so outdated ones are unexpected
+                aggregates = self.aggregator.serialize(sample for sample in samples if sample not in ignored)
+                outdated_aggregates = Stats.insert(aggregates)
+        except:
+            # caches were updated ahead of the rolled back transaction
+            Stats.discard(set(id for id, dt, value in samples).union(self.aggregator.series.values()))
+            self.aggregator.clear()
+            raise
+        if outdated:
+            log.warn("Outdated samples ignored: {0}".format(outdated))
+        if outdated_aggregates:
+            log.debug("Outdated aggregate samples ignored: {0}".format(outdated_aggregates))
 
     def stop(self):
         super(Service, self).stop()
 
         self.queue.stop()
+        log.info("Stats cache usage: {0}".format(Stats.cache_info()))
@@ -20,3 +20,14 @@ SERVICE_PID=$!
 
 kill -INT $SERVICE_PID
 wait $SERVICE_PID
+
+./manage.py chroma_service --local-transport pinger &
+SERVICE_PID=$!
+
+./manage.py chroma_service --local-transport pinger_client
+./manage.py chroma_service --local-transport --lightweight-rpc pinger_client
+./manage.py chroma_service --local-transport --gevent pinger_client
+./manage.py chroma_service --local-transport --gevent --lightweight-rpc pinger_client
+
+kill -INT $SERVICE_PID
+wait $SERVICE_PID
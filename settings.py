@@ -153,6 +153,14 @@ AMQP_BROKER_HOST = os.getenv("AMQP_BROKER_HOST", "localhost")
 
 BROKER_URL = "amqp://%s:%s@%s:5672/%s" % (AMQP_BROKER_USER, AMQP_BROKER_PASSWORD, AMQP_BROKER_HOST, AMQP_BROKER_VHOST)
 
+# Serializer for messages between services: 'json', or 'iml-msgpack' once msgpack is installed for every service.
+SERVICE_SERIALIZER = 'json'
+
+# Transport for messages between services: 'amqp' through the broker, or 'local' over Unix domain
+# sockets in LOCAL_TRANSPORT_PATH, when every service runs on this node with the same setting.
+SERVICE_TRANSPORT = 'amqp'
+LOCAL_TRANSPORT_PATH = '/var/run/iml-transport'
+
 INSTALLED_APPS = (
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -258,6 +266,8 @@ STATS_5_MINUTE_EXPIRATION = {'days': 7}     # Expiration must be multiple of 5 m
 STATS_1_HOUR_EXPIRATION = {'days': 30}      # Expiration must be multiple of 1 hour.
 STATS_1_DAY_EXPIRATION = {'weeks': 10000}   # Expiration must be multiple of 1 day
 STATS_FLUSH_RATE = 20                       # Flush 20 times per expiration interval - for 10 seconds sample flush every 1day/20.
+STATS_PARTITIONED = False                   # True stores samples in time range partitions (postgres only), dropped whole on expiry instead of deleting rows.
+STATS_ARCHIVE = False                       # True packs 1 hour and 1 day samples into compressed archives, once older than 240 samples.
 
 # When agent sends VPD 0x80 and 0x83 serial numbers, which do we prefer to use
 # for the canonical device serial on the manager?  Favorite first.
@@ -72,6 +72,13 @@ class ChromaApiTestCase(ResourceTestCase):
         self.old_get_locks = job_scheduler_client.JobSchedulerClient.get_locks
         job_scheduler_client.JobSchedulerClient.get_locks = fake_get_locks
 
+        @classmethod
+        def fake_get_locks_many(cls, object_list):
+            return [cls.get_locks(obj_key, obj_id) for obj_key, obj_id in object_list]
+
+        self.old_get_locks_many = job_scheduler_client.JobSchedulerClient.get_locks_many
+        job_scheduler_client.JobSchedulerClient.get_locks_many = fake_get_locks_many
+
     def tearDown(self):
         from chroma_api.authentication import CsrfAuthentication
         CsrfAuthentication.is_authenticated = self.old_is_authenticated
@@ -80,6 +87,7 @@ class ChromaApiTestCase(ResourceTestCase):
         from chroma_core.services.job_scheduler import job_scheduler_client
         job_scheduler_client.JobSchedulerClient.available_transitions = self.old_available_transitions
         job_scheduler_client.JobSchedulerClient.available_jobs = self.old_available_jobs
+        job_scheduler_client.JobSchedulerClient.get_locks_many = self.old_get_locks_many
 
         ObjectCache.clear()
 
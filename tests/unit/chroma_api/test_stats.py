@@ -6,7 +6,7 @@ import operator
 from chroma_core.lib.cache import ObjectCache
 from chroma_core.lib import metrics
 from chroma_core.models import ManagedTarget, ManagedTargetMount, ManagedMgs, ManagedMdt, ManagedOst, ManagedFilesystem
-from chroma_core.models import Stats
+from chroma_core.models import Series, Stats
 from .chroma_api_test_case import ChromaApiTestCase
 from tests.unit.chroma_core.helpers import synthetic_host, synthetic_volume_full
 
@@ -137,3 +137,18 @@ class TestStats(ChromaApiTestCase):
         for data, in content.values():
             prefixes = set(name.split('_')[0] for name in data['data'])
             self.assertEqual(prefixes, set(['mem', 'cpu']))
+
+    def test_filesystem_aggregates(self):
+        "Verify aggregate series maintained by the stats service match summing the targets."
+        fetches = [(ManagedOst, ['kbytesfree', 'kbytestotal']), (ManagedMdt, ['filesfree', 'filestotal'])]
+        expected = [self.fs.metrics.fetch_last(klass, names)[1] for klass, names in fetches]
+        samples = []
+        for target in [self.mdt] + self.osts:
+            for series in Series.filter(target.downcast()):
+                point = Stats.latest(series.id)
+                samples.append((series.id, point.dt, point.mean))
+        Stats.insert(metrics.FilesystemAggregator().serialize(samples))
+        for klass, names in fetches:
+            for name in names:
+                self.assertTrue(Series.filter(self.fs, name=self.fs.metrics.aggregate_name(klass, name)).exists())
+        self.assertEqual([self.fs.metrics.fetch_last(klass, names)[1] for klass, names in fetches], expected)
@@ -45,6 +45,10 @@ class TestTargetResource(ChromaApiTestCase):
         })
         self.assertHttpAccepted(response)
 
+        content = json.loads(response.content)
+        self.assertIn('command', content)
+        self.assertEqual(content['target']['locks'], {'read': [1, 2], 'write': [3, 4]})
+
     @create_targets_patch
     def test_patch_creation(self):
         """Test that creating multiple Targets using PATCH returns a target and a command"""
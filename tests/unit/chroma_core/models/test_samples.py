@@ -10,8 +10,9 @@ from django.db import connection
 from django.utils.unittest import skipIf
 
 from tests.unit.lib.iml_unit_test_case import IMLUnitTestCase
-from chroma_core.models import Point, Stats
-from chroma_core.models.stats import total_seconds
+from chroma_core.models import Point, Stats, LatestSample, SampleArchive
+from chroma_core.models.stats import total_seconds, Columns
+from chroma_core.lib import stats_archive
 from chroma_core.lib.util import chroma_settings
 
 
@@ -43,6 +44,8 @@ def assertQueries(*prefixes):
     yield
     for prefix, query in itertools.izip_longest(prefixes, connection.queries[count:]):
         assert prefix and query and query['sql'].startswith(prefix), (prefix, query)
+        if prefix == 'COPY':
+            continue
         cursor = connection.cursor()
         cursor.execute('EXPLAIN ' + query['sql'])
         plan = ''.join(row for row, in cursor)
@@ -93,7 +96,7 @@ class TestModels(IMLUnitTestCase):
 
         model.objects.all().delete()
 
-        with assertQueries('INSERT', 'SELECT'):
+        with assertQueries('COPY', 'SELECT'):
             model.insert({id: points})
             point = model.latest(id)
             model.cache.clear()
@@ -121,7 +124,7 @@ class TestModels(IMLUnitTestCase):
 
         model.objects.all().delete()
 
-        with assertQueries('INSERT', 'SELECT'):
+        with assertQueries('COPY', 'SELECT'):
             model.insert({id: points})
             point = model.latest(id)
             model.cache.clear()
@@ -157,11 +160,92 @@ class TestModels(IMLUnitTestCase):
         self.assertListEqual(list(model.select(id)), [])
         self.assertTrue(Stats[-1].start(id))
 
+    def test_sample_partitioned(self):
+        model = Stats[0]
+        settings.STATS_PARTITIONED = True
+        try:
+            old_point = Point(epoch, 1, 1)
+            model.insert({id: [old_point] + points})
+            self.assertListEqual(list(model.select(id)), [old_point] + points)
+            expired, current = model.partition(old_point.dt), model.partition(points[-1].dt)
+            self.assertIn(expired, model.partitions())
+
+            # Expiry drops the old partition as a whole, and keeps the current one
+            model.next_flush_orphans_time = epoch
+            model.expire([id])
+            self.assertNotIn(expired, model.partitions())
+            self.assertIn(current, model.partitions())
+            self.assertListEqual(list(model.select(id)), points)
+        finally:
+            settings.STATS_PARTITIONED = False
+            model.partition_ranges = None
+
+    def test_sample_archive(self):
+        model = Stats[3]
+        step = timedelta(seconds=model.step)
+        start = model.floor(now) - step * SampleArchive.POINTS * 3
+        sparse = [Point(start + step * n, n / 3.0, 1 + n % 4) for n in xrange(0, SampleArchive.POINTS * 3, 2)]
+        rows = [(point.timestamp, point.sum, point.len) for point in sparse]
+        self.assertListEqual(stats_archive.decode(stats_archive.encode(rows, model.step), model.step), rows)
+
+        settings.STATS_ARCHIVE = True
+        try:
+            model.insert({id: sparse})
+            self.assertGreater(model.pack(now), 0)
+            self.assertGreater(SampleArchive.objects.filter(id=id, step=model.step).count(), 1)
+            self.assertLess(model.objects.filter(id=id).count(), len(sparse))
+            self.assertEqual(model.pack(now), 0)
+
+            # Selecting is transparent to whether points are archived
+            self.assertListEqual(list(model.select(id)), sparse)
+            self.assertEqual(model.latest(id), sparse[-1])
+            self.assertListEqual(list(model.select(id, order_by='-dt', limit=3)), sparse[:-4:-1])
+            self.assertListEqual(list(model.select(id, dt__gte=sparse[10].dt, dt__lt=sparse[20].dt)), sparse[10:20])
+            self.assertEqual(model.starts([id])[id], model.start(id))
+
+            # Late points are merged into existing archives
+            late = Point(sparse[0].dt + step, 1.0, 1)
+            model.insert({id: [late]})
+            self.assertEqual(model.pack(now), 1)
+            self.assertListEqual(list(model.select(id))[:3], [sparse[0], late, sparse[1]])
+
+            Stats.delete(id)
+            self.assertFalse(SampleArchive.objects.filter(id=id).exists())
+        finally:
+            settings.STATS_ARCHIVE = False
+
+    def test_columns(self):
+        columns = Columns()
+        columns.extend(id, points)
+        columns.extend(id + 1, points[:10])
+        self.assertEqual(len(columns), len(points) + 10)
+        for model in Stats[1:]:
+            groups = dict(columns.reduce(model.step).groups())
+            self.assertListEqual(groups[id], list(model.reduce(points)))
+            self.assertListEqual(groups[id + 1], list(model.reduce(points[:10])))
+
+    def test_preload(self):
+        Stats.insert((id, point.dt, point.sum) for point in points)
+        latest = [model.latest(id) for model in Stats]
+        for model in Stats:
+            model.cache.clear()
+        loaded = Stats.preload()
+        self.assertEqual(loaded[Stats[0].__name__], 1)
+        for model, point in zip(Stats, latest):
+            if point.len:
+                with assertQueries():
+                    self.assertEqual(model.latest(id), point)
+                self.assertLessEqual(len(model.cache[id]), model.maxlen)
+
     def test_stats(self):
         outdated = Stats.insert((id, point.dt, point.sum) for point in points)
         self.assertEqual(outdated, [])
         with assertQueries():
             point = Stats.latest(id)
+        self.assertEqual(Stats.latest_many([id, id + 1]), {id: point, id + 1: Point.zero})
+        LatestSample.objects.all().delete()
+        self.assertEqual(Stats.refresh_latest(), 1)
+        self.assertEqual(Stats.latest_many([id]), {id: point})
         sample = id, point.dt, point.sum
         self.assertEqual(Stats.insert([sample]), [sample])
         self.assertEqual(point.timestamp % 10, 0)
@@ -178,6 +262,10 @@ class TestModels(IMLUnitTestCase):
         self.assertLessEqual(len(timestamps), 100)
         self.assertFalse(any(timestamp % 60 for timestamp in timestamps))
         self.assertTrue(any(timestamp % 300 for timestamp in timestamps))
+        for maxlen in (float('inf'), 100):
+            selection = Stats.select_many([id, id + 1], point.dt - timedelta(hours=1), point.dt, rates=[id], maxlen=maxlen)
+            self.assertListEqual(selection[id], Stats.select(id, point.dt - timedelta(hours=1), point.dt, rate=True, maxlen=maxlen))
+            self.assertListEqual(selection[id + 1], [])
         for point in Stats.select(id, point.dt - timedelta(hours=1), point.dt, rate=True):
             self.assertEqual(point[1:], (1.0, 10))
         selection = list(Stats.select(id, now - timedelta(seconds=30), now + timedelta(seconds=30), fixed=3))
@@ -7,7 +7,7 @@ from django.contrib.auth.models import User
 from tests.unit.lib.iml_unit_test_case import IMLUnitTestCase
 from tests.utils import patch
 from chroma_core.lib import metrics
-from chroma_core.models.stats import Series, Stats, timestamp
+from chroma_core.models.stats import Cache, Series, Stats, timestamp
 
 
 fields = ('size', 'Gauge', 0, 1000), ('bandwith', 'Counter', 0, 100), ('speed', 'Derive', -100, 100)
@@ -42,6 +42,20 @@ class TestSeries(IMLUnitTestCase):
             self.assertEqual(series, Series.get(self.obj, field))
         self.assertFalse(Series.cache)
 
+    def test_cache(self):
+        cache = Cache(list)
+        with patch(cache, SIZE=2):
+            cache['a'].append(1)
+            cache['b'].append(2)
+            self.assertEqual(cache['a'], [1])
+            cache['c'].append(3)
+            self.assertNotIn('b', cache)
+            self.assertEqual(sorted(cache), ['a', 'c'])
+        self.assertEqual(cache.info(), {'size': 2, 'hits': 1, 'misses': 3, 'evictions': 1})
+        cache = Cache()
+        self.assertRaises(KeyError, cache.__getitem__, 'a')
+        self.assertEqual(cache.info()['misses'], 1)
+
     def test_fast(self):
         "Small data set with short intervals."
         for data in zip(*[gen_series(5, 100)] * 10):
@@ -102,3 +116,12 @@ class TestSeries(IMLUnitTestCase):
         counts = [model.objects.filter(id=series.id).count() for model in Stats]
         self.assertLess(counts.pop(0), rows)
         self.assertEqual(counts, sorted(counts, reverse=True))
+
+    def test_out_of_order(self):
+        "Samples within a message are only compared against the stored latest point."
+        series = Series.get(self.obj, 'size', 'Gauge')
+        samples = [(series.id, epoch + timedelta(seconds=seconds), value) for seconds, value in [(20, 2), (10, 1)]]
+        self.assertEqual(Stats.insert(samples), [])
+        self.assertEqual([point.sum for point in Stats[0].select(series.id)], [1.0, 2.0])
+        outdated = [(series.id, epoch + timedelta(seconds=15), 3)]
+        self.assertEqual(Stats.insert(outdated), outdated)
@@ -0,0 +1,25 @@
+from tests.unit.lib.iml_unit_test_case import IMLUnitTestCase
+
+from chroma_core.lib.util import all_subclasses
+from chroma_core.models import LNetConfiguration
+from chroma_core.models.jobs import StatefulObject
+
+
+class TestStatefulObjectRoutes(IMLUnitTestCase):
+    "Validate that routes are the shortest chain of state change jobs between states."
+
+    def test_lnet_routes(self):
+        self.assertEqual(LNetConfiguration.get_route('lnet_up', 'lnet_unloaded'), ('lnet_up', 'lnet_down', 'lnet_unloaded'))
+        self.assertEqual(LNetConfiguration.get_route('lnet_unloaded', 'lnet_up'), ('lnet_unloaded', 'lnet_down', 'lnet_up'))
+
+    def test_routes(self):
+        for klass in all_subclasses(StatefulObject):
+            if klass._meta.abstract or not klass.states:
+                continue
+            klass._build_maps()
+            for (begin_state, end_state), route in klass.route_map.items():
+                self.assertEqual((route[0], route[-1]), (begin_state, end_state))
+                self.assertEqual(len(set(route)), len(route))
+                for step in zip(route, route[1:]):
+                    self.assertIn(step, klass.job_class_map)
+                self.assertIn(end_state, klass.transition_map[begin_state])
@@ -10,7 +10,7 @@ from chroma_core.models import ManagedTargetMount
 from chroma_core.models import Nid
 from chroma_core.services.plugin_runner.agent_daemon_interface import AgentDaemonRpcInterface
 from chroma_core.services.queue import ServiceQueue
-from chroma_core.services.rpc import ServiceRpcInterface
+from chroma_core.services.rpc import ServiceRpcInterface, BATCH_METHOD
 from tests.unit.chroma_core.helpers import MockAgentRpc, synthetic_volume_full, freshen
 from tests.unit.chroma_core.helpers import MockAgentSsh, log, load_default_profile, synthetic_host, parse_synthentic_device_info
 from tests.unit.lib.iml_unit_test_case import IMLUnitTestCase
@@ -121,7 +121,12 @@ class JobTestCase(IMLUnitTestCase):
             def rpc_local(fn_name, *args, **kwargs):
                 # Run the response through a serialize/deserialize cycle to
                 # give it that special RPC flavor.
-                retval = json.loads(json.dumps(getattr(test_daemon, fn_name)(*args, **kwargs)))
+                if fn_name == BATCH_METHOD:
+                    # Batched calls are unpacked into per-call responses, as RpcServer does
+                    result = rpc_class(test_daemon)._local_call_many(fn_name, *args)
+                else:
+                    result = getattr(test_daemon, fn_name)(*args, **kwargs)
+                retval = json.loads(json.dumps(result))
                 log.info("patch_daemon_rpc: %s(%s %s) -> %s" % (fn_name, args, kwargs, retval))
                 return retval
 
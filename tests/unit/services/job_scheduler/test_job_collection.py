@@ -0,0 +1,34 @@
+import json
+
+import mock
+from django.utils import unittest
+
+from chroma_core.services.job_scheduler.job_scheduler import JobCollection
+
+
+class TestJobCollection(unittest.TestCase):
+    "Validate that jobs become ready as the jobs they wait for complete."
+
+    def _job(self, id, wait_for = ()):
+        return mock.Mock(id = id, state = 'pending', wait_for_json = json.dumps(list(wait_for)))
+
+    @mock.patch('chroma_core.services.job_scheduler.job_scheduler.Job')
+    def test_ready_jobs(self, Job):
+        collection = JobCollection()
+        jobs = [self._job(1), self._job(2, [1]), self._job(3, [1, 2]), self._job(4, [1])]
+        collection.add_command(mock.Mock(id = 1), jobs)
+        self.assertEqual(collection.ready_jobs, [jobs[0]])
+
+        collection.update_many([jobs[0]], 'tasked')
+        self.assertEqual(collection.ready_jobs, [])
+        collection.update(jobs[0], 'complete')
+        self.assertEqual(sorted(job.id for job in collection.ready_jobs), [2, 4])
+
+        collection.update_many([jobs[1], jobs[3]], 'tasked')
+        collection.update(jobs[1], 'complete')
+        self.assertEqual(collection.ready_jobs, [jobs[2]])
+
+        # A job added after those it waits for are complete is ready at once
+        late = self._job(5, [1, 2])
+        collection.add_command(mock.Mock(id = 2), [late])
+        self.assertEqual(sorted(job.id for job in collection.ready_jobs), [3, 5])
@@ -2,6 +2,7 @@ import datetime
 
 import mock
 import django.utils.timezone
+from django.contrib.contenttypes.models import ContentType
 
 from chroma_core.lib.cache import ObjectCache
 from chroma_core.models.jobs import SchedulingError, Job
@@ -139,6 +140,22 @@ class TestStateManager(JobTestCaseWithHost):
         job_scheduler_notify.notify(freshen(self.lnet_configuration), now, {'state': 'lnet_down'}, ['lnet_up'])
         self.assertEqual(freshen(self.lnet_configuration).state, 'lnet_down')
 
+    def test_available_bulk(self):
+        """Test that transitions and jobs are computed for a batch of objects, and that
+        objects which don't exist get none"""
+        lnet_key = list(ContentType.objects.get_for_model(self.lnet_configuration).natural_key())
+        host_key = list(ContentType.objects.get_for_model(self.host).natural_key())
+        lnet_configuration = freshen(self.lnet_configuration)
+
+        transitions = self.job_scheduler.available_transitions([(lnet_key, lnet_configuration.id), (lnet_key, 0)])
+        self.assertEqual(transitions[lnet_configuration.id],
+                         self.job_scheduler._add_verbs(lnet_configuration, lnet_configuration.get_available_states(lnet_configuration.state)))
+        self.assertEqual(transitions[0], [])
+
+        jobs = self.job_scheduler.available_jobs([(host_key, self.host.id), (host_key, 0)])
+        self.assertEqual(jobs[self.host.id], self.job_scheduler._fetch_jobs(freshen(self.host)))
+        self.assertEqual(jobs[0], [])
+
     def test_late_notification(self):
         """Test that notifications are droppped when they are older than
         the last change to an objects state"""
@@ -147,6 +164,27 @@ class TestStateManager(JobTestCaseWithHost):
         job_scheduler_notify.notify(freshen(self.lnet_configuration), awhile_ago, {'state': 'lnet_down'}, ['lnet_up'])
         self.assertEqual(freshen(self.lnet_configuration).state, 'lnet_up')
 
+    def test_coalesced_notification(self):
+        """Test that notifications within a coalesce block are merged per object, and
+        sent as one message when leaving the block"""
+        from chroma_core.services.job_scheduler.job_scheduler_notify import NotificationQueue
+        self.lnet_configuration = self.assertState(self.lnet_configuration, 'lnet_up')
+        now = django.utils.timezone.now()
+        later = now + datetime.timedelta(seconds = 1)
+        put_count = NotificationQueue.put.call_count
+
+        with job_scheduler_notify.coalesce():
+            job_scheduler_notify.notify(freshen(self.host), later, {'boot_time': later})
+            job_scheduler_notify.notify(freshen(self.host), now, {'boot_time': now})
+            job_scheduler_notify.notify(freshen(self.lnet_configuration), now, {'state': 'lnet_down'}, ['lnet_up'])
+            self.assertEqual(NotificationQueue.put.call_count, put_count)
+            self.assertEqual(freshen(self.lnet_configuration).state, 'lnet_up')
+
+        self.assertEqual(NotificationQueue.put.call_count, put_count + 1)
+        self.assertEqual(len(NotificationQueue.put.call_args[0][0]), 2)
+        self.assertEqual(freshen(self.lnet_configuration).state, 'lnet_down')
+        self.assertEqual(freshen(self.host).boot_time, later)
+
     def test_buffered_notification(self):
         """Test that notifications for locked items are buffered and
         replayed when the locking Job has completed."""
@@ -0,0 +1,87 @@
+import mock
+from django.utils import unittest
+
+from chroma_core.services.job_scheduler.lock_cache import LocksByJob, LockCache
+
+
+class TestLocksByJob(unittest.TestCase):
+    "Validate that locks on an item are kept in job order as they are added and removed."
+
+    def test_order(self):
+        jobs = [mock.Mock(id = id) for id in range(4)]
+        locks = [mock.Mock(job = jobs[id]) for id in (3, 1, 2, 1)]
+        item_locks = LocksByJob()
+        for lock in locks:
+            item_locks.add(lock)
+
+        self.assertEqual(list(item_locks), [locks[1], locks[3], locks[2], locks[0]])
+        self.assertIs(item_locks.latest(), locks[0])
+        self.assertIs(item_locks.latest(not_job = jobs[3]), locks[2])
+        self.assertEqual(item_locks.after(2), [locks[2], locks[0]])
+
+        item_locks.remove(locks[1])
+        item_locks.remove(locks[0])
+        self.assertEqual(list(item_locks), [locks[3], locks[2]])
+        self.assertEqual(item_locks.after(0), [locks[3], locks[2]])
+        self.assertIsNone(LocksByJob().latest())
+
+
+class TestLockSnapshot(unittest.TestCase):
+    "Validate that each change to the locks publishes a new snapshot, leaving earlier ones unchanged."
+
+    @mock.patch('chroma_core.models.Job')
+    def test_snapshot(self, Job):
+        Job.objects.filter.return_value = []
+        lock_cache = LockCache()
+        jobs = [mock.Mock(id = id) for id in range(3)]
+        host, target = mock.Mock(), mock.Mock()
+        locks = [mock.Mock(job = jobs[0], locked_item = host, write = True),
+                 mock.Mock(job = jobs[1], locked_item = host, write = False),
+                 mock.Mock(job = jobs[2], locked_item = target, write = True)]
+        initial = lock_cache.snapshot
+        for lock in locks:
+            lock_cache.add(lock)
+
+        snapshot = lock_cache.snapshot
+        self.assertEqual(snapshot.version, initial.version + 3)
+        self.assertEqual((snapshot.write_job_ids(host), snapshot.read_job_ids(host)), ((0,), (1,)))
+        self.assertTrue(snapshot.is_write_locked(target))
+        self.assertFalse(initial.is_write_locked(host))
+
+        lock_cache.remove_job(jobs[0])
+        self.assertFalse(lock_cache.snapshot.is_write_locked(host))
+        self.assertEqual(lock_cache.snapshot.read_job_ids(host), (1,))
+        self.assertEqual(snapshot.write_job_ids(host), (0,))
+
+    @mock.patch('chroma_core.models.Job')
+    def test_batch(self, Job):
+        Job.objects.filter.return_value = []
+        lock_cache = LockCache()
+        jobs = [mock.Mock(id = id) for id in range(2)]
+        host = mock.Mock()
+        initial = lock_cache.snapshot
+        with lock_cache.batch():
+            with lock_cache.batch():
+                lock_cache.add(mock.Mock(job = jobs[0], locked_item = host, write = True))
+            lock_cache.add(mock.Mock(job = jobs[1], locked_item = host, write = True))
+            self.assertIs(lock_cache.snapshot, initial)
+
+        self.assertEqual(lock_cache.snapshot.version, initial.version + 1)
+        self.assertEqual(lock_cache.snapshot.write_job_ids(host), (0, 1))
+
+    @mock.patch('chroma_core.models.Job')
+    def test_states(self, Job):
+        Job.objects.filter.return_value = []
+        lock_cache = LockCache()
+        host, target = mock.Mock(state = 'managed'), mock.Mock(state = 'mounted')
+        lock_cache.add(mock.Mock(job = mock.Mock(id = 0), locked_item = host, write = True))
+        locked = lock_cache.snapshot
+
+        lock_cache.publish_states([host, target])
+        self.assertEqual(lock_cache.snapshot.state(host), 'managed')
+        self.assertTrue(lock_cache.snapshot.is_write_locked(host))
+        self.assertEqual(locked.state(host, 'unknown'), 'unknown')
+
+        lock_cache.publish_states([], removed = [target])
+        self.assertIsNone(lock_cache.snapshot.state(target))
+        self.assertEqual(lock_cache.snapshot.state(host), 'managed')
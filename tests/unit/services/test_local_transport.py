@@ -0,0 +1,71 @@
+import shutil
+import time
+import tempfile
+
+import mock
+from django.utils import unittest
+
+from chroma_core.services import local_transport, _amqp_connection
+
+
+class TestLocalTransport(unittest.TestCase):
+    "Validate that messages reach the queue's consumer through its socket, in order."
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.settings = mock.patch('settings.LOCAL_TRANSPORT_PATH', self.path)
+        self.settings.start()
+
+    def tearDown(self):
+        local_transport.shutdown()
+        self.settings.stop()
+        shutil.rmtree(self.path)
+
+    def test_send(self):
+        channel = local_transport.Channel.__new__(local_transport.Channel)
+        self.assertEqual(channel._lookup('rpc', 'acme.requests'), ['acme.requests'])
+
+        listener = local_transport.listen('acme')
+        self.assertIs(local_transport.listen('acme'), listener)
+        messages = [{'body': '\x00\xff', 'properties': {'delivery_tag': index}} for index in range(3)]
+        for message in messages:
+            local_transport.send('acme', message)
+
+        self.assertEqual([channel._get('acme') for _ in messages], messages)
+        self.assertEqual(channel._size('acme'), 0)
+
+        local_transport.unlisten('acme')
+        self.assertRaises(Exception, channel._get, 'acme')
+
+    def test_send_before_listen(self):
+        messages = [{'body': 'foo', 'properties': {'delivery_tag': index}} for index in range(2)]
+        for message in messages:
+            local_transport.send('acme', message)
+
+        listener = local_transport.listen('acme')
+        self.assertEqual([listener.messages.get(timeout = 5) for _ in messages], messages)
+
+    def test_connection(self):
+        with mock.patch('settings.SERVICE_TRANSPORT', 'local'):
+            with _amqp_connection() as connection:
+                queue = connection.SimpleQueue('acme')
+                # published before the queue is consumed, on the first get
+                queue.put({'foo': 'bar'})
+                message = queue.get(timeout = 5)
+                message.ack()
+                self.assertEqual(message.payload, {'foo': 'bar'})
+                queue.close()
+
+    def test_expiry(self):
+        with mock.patch.multiple(local_transport, HOLD_TIMEOUT = 0.2, IDLE_TIMEOUT = 0):
+            local_transport.send('acme', {'body': 'foo'})
+            sender = local_transport._senders['acme']
+            for _ in range(100):
+                if not sender._backlog:
+                    break
+                time.sleep(0.05)
+            self.assertEqual(len(sender._backlog), 0)
+
+            # idle senders are forgotten on a later send
+            local_transport.send('widget', {'body': 'bar'})
+            self.assertNotIn('acme', local_transport._senders)
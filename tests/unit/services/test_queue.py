@@ -0,0 +1,60 @@
+import mock
+
+from django.utils import unittest
+
+from chroma_core.services.queue import ServiceQueue
+
+# JobTestCase replaces ServiceQueue.put with a mock, so keep the original from import time
+put = ServiceQueue.__dict__['put']
+
+
+class AcmeQueue(ServiceQueue):
+    name = 'acme'
+
+
+class TestServiceQueue(unittest.TestCase):
+    "Validate that puts publish through the producer pool, and are counted."
+
+    @mock.patch('chroma_core.services.queue.maybe_declare')
+    @mock.patch('chroma_core.services.queue.producers')
+    def test_put(self, producers, maybe_declare):
+        producer = producers.__getitem__.return_value.acquire.return_value.__enter__.return_value
+        before = ServiceQueue.publish_stats().get('acme', {'publishes': 0})['publishes']
+
+        put(AcmeQueue(), {'foo': 'bar'})
+        put(AcmeQueue(), {'foo': 'baz'})
+
+        self.assertEqual(producers.__getitem__.return_value.acquire.call_count, 2)
+        queue = maybe_declare.call_args[0][0]
+        self.assertEqual((queue.name, queue.exchange.name, queue.routing_key), ('acme', 'acme', 'acme'))
+        self.assertFalse(queue.durable or queue.exchange.durable)
+        args, kwargs = producer.publish.call_args
+        self.assertEqual(args, ({'foo': 'baz'},))
+        self.assertEqual((kwargs['exchange'], kwargs['routing_key'], kwargs['serializer']), (queue.exchange, 'acme', 'json'))
+
+        kwargs['retry_policy']['errback'](IOError(), 1)
+        stats = ServiceQueue.publish_stats()['acme']
+        self.assertEqual(stats['publishes'], before + 2)
+        self.assertGreaterEqual(stats['reconnects'], 1)
+        self.assertGreaterEqual(stats['max_latency'], stats['latency'])
+
+    @mock.patch('chroma_core.services.queue._amqp_connection')
+    def test_serve_many(self, connection):
+        from Queue import Empty
+        queue = AcmeQueue()
+        messages = [mock.Mock(**{'decode.return_value': index}) for index in range(5)]
+        simple_queue = connection.return_value.__enter__.return_value.SimpleQueue.return_value
+
+        def get(timeout):
+            if messages:
+                return messages.pop(0)
+            queue.stop()
+            raise Empty()
+        simple_queue.get.side_effect = get
+        batches = []
+
+        queue.serve_many(batches.append, batch_size = 2)
+
+        simple_queue.consumer.qos.assert_called_once_with(prefetch_count = 2)
+        self.assertEqual(batches, [[0, 1], [2, 3], [4]])
+        self.assertEqual(simple_queue.get.call_count, 6)
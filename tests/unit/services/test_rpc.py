@@ -0,0 +1,159 @@
+import threading
+import time
+
+import mock
+from django.utils import unittest
+
+from chroma_core.services.rpc import RpcWorkerPool, RpcClientResponseHandler, RpcTimeout, RpcError, ServiceRpcInterface
+from chroma_core.services.rpc import RpcResponseFuture, RpcClient, gather
+
+
+class TestRpcWorkerPool(unittest.TestCase):
+    "Validate that RPCs run on a bounded set of reused threads."
+
+    def test_bounded(self):
+        pool = RpcWorkerPool('test', limit = 2, backlog = 10)
+        release = threading.Event()
+        started = []
+        done = threading.Semaphore(0)
+
+        def rpc():
+            started.append(threading.current_thread())
+            release.wait()
+            done.release()
+
+        for _ in range(5):
+            pool.submit(rpc)
+        self.assertEqual(pool.stats()['threads'], 2)
+
+        release.set()
+        for _ in range(5):
+            done.acquire()
+        self.assertEqual(len(set(started)), 2)
+
+        # the last call is counted just after it returns
+        for _ in range(100):
+            if pool.stats()['calls'] == 5:
+                break
+            time.sleep(0.01)
+        stats = pool.stats()
+        self.assertEqual(stats['calls'], 5)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertGreaterEqual(stats['max_service_time'], stats['mean_service_time'])
+        pool.stop()
+
+    def test_unbounded(self):
+        pool = RpcWorkerPool('test', None, None, idle_timeout = 0.1)
+        release = threading.Event()
+        started = threading.Semaphore(0)
+
+        def rpc():
+            started.release()
+            release.wait()
+
+        for _ in range(5):
+            pool.submit(rpc)
+        for _ in range(5):
+            self.assertTrue(started.acquire())
+        self.assertEqual(pool.stats()['threads'], 5)
+
+        # idle threads exit
+        release.set()
+        for _ in range(100):
+            if not pool.stats()['threads']:
+                break
+            time.sleep(0.05)
+        self.assertEqual(pool.stats()['threads'], 0)
+
+    def test_exception(self):
+        pool = RpcWorkerPool('test', limit = 1, backlog = 10)
+        done = threading.Event()
+
+        def fail():
+            raise RuntimeError()
+
+        pool.submit(fail)
+        pool.submit(done.set)
+        self.assertTrue(done.wait(10))
+        self.assertEqual(pool.stats()['threads'], 1)
+        pool.stop()
+
+
+class TestRpcClientResponseHandler(unittest.TestCase):
+    "Validate that only expired requests are aged out, and that calls in flight are counted."
+
+    def test_deadlines(self):
+        handler = RpcClientResponseHandler('test.responses')
+        expired = handler.start_wait('expired', -1, 'wait_table_change')
+        pending = handler.start_wait('pending', 300, 'wait_table_change')
+        answered = handler.start_wait('answered', -1, 'set_state')
+        self.assertEqual(handler.in_flight(), {'wait_table_change': 2, 'set_state': 1})
+        handler.complete('answered', {'result': 1})
+
+        handler._age_response_states()
+        self.assertEqual(len(handler._deadlines), 1)
+        self.assertTrue(expired.complete.is_set() and expired.timeout)
+        self.assertEqual(answered.result, {'result': 1})
+        self.assertFalse(answered.timeout)
+        self.assertFalse(pending.complete.is_set())
+        # states are dropped as they complete, whether or not they are collected
+        self.assertEqual(handler._response_states.keys(), ['pending'])
+        self.assertEqual(handler.in_flight(), {'wait_table_change': 1})
+
+    def test_futures(self):
+        handler = RpcClientResponseHandler('test.responses')
+        futures = []
+        for request_id in 'ok', 'failed', 'expired':
+            state = handler.start_wait(request_id, -1 if request_id == 'expired' else 300, 'set_state')
+            futures.append(RpcResponseFuture(state, 'set_state', request_id))
+        self.assertRaises(RpcTimeout, futures[0].result, 0)
+
+        for request_id, exception in ('ok', None), ('failed', 'failed'):
+            handler.complete(request_id, {'request_id': request_id, 'result': request_id, 'exception': exception})
+        handler._age_response_states()
+
+        self.assertTrue(all(future.done() for future in futures))
+        results = gather(futures, return_exceptions = True)
+        self.assertEqual(results[0], 'ok')
+        self.assertIsInstance(results[1], RpcError)
+        self.assertIsInstance(results[2], RpcTimeout)
+        self.assertRaises(RpcError, gather, futures)
+        self.assertEqual(handler.in_flight(), {})
+
+    def test_shared(self):
+        handler = RpcClientResponseHandler('test.responses')
+        clients = RpcClient('acme', response_thread = handler), RpcClient('widget', response_thread = handler)
+        handler.start_wait('one', 300, ('acme', 'set_state'))
+        handler.start_wait('two', 300, ('acme', 'set_state'))
+        handler.start_wait('three', 300, ('widget', 'set_state'))
+        self.assertEqual([client.in_flight() for client in clients], [{'set_state': 2}, {'set_state': 1}])
+        self.assertEqual(clients[0]._response_routing_key, clients[1]._response_routing_key)
+
+
+class Acme(object):
+    def double(self, x):
+        return x * 2
+
+    def fail(self):
+        raise ValueError("failed")
+
+
+class AcmeRpc(ServiceRpcInterface):
+    methods = ['double', 'fail']
+
+
+class TestServiceRpcBatch(unittest.TestCase):
+    "Validate that calls in a batch are sent in one request, and get their own results."
+
+    def test_batch(self):
+        server = AcmeRpc(Acme())
+        client = AcmeRpc()
+        with mock.patch.object(AcmeRpc, '_call', side_effect = lambda fn_name, *args, **kwargs: server._local_call_many(fn_name, *args)) as call:
+            with client.batch() as batch:
+                doubled = [batch.double(x) for x in range(3)]
+                failed = batch.fail()
+                self.assertFalse(failed.done())
+
+        self.assertEqual(call.call_count, 1)
+        self.assertEqual([future.result() for future in doubled], [0, 2, 4])
+        self.assertRaises(RpcError, failed.result)
@@ -0,0 +1,26 @@
+import datetime
+
+import mock
+from django.utils import unittest
+from django.utils.timezone import utc
+
+from chroma_core.services import serializers
+
+
+class TestSerializers(unittest.TestCase):
+    @unittest.skipIf(serializers.msgpack is None, "msgpack not installed")
+    def test_msgpack(self):
+        now = datetime.datetime.now()
+        body = {'request_id': 'abc', 'args': [1, 2.5, None, True], 'times': [now, now.replace(tzinfo = utc)]}
+        self.assertEqual(serializers.loads(serializers.dumps(body)), body)
+        self.assertEqual(serializers.loads(serializers.dumps(datetime.datetime(1969, 12, 31, 23, 59, 59, 1))),
+                         datetime.datetime(1969, 12, 31, 23, 59, 59, 1))
+        self.assertIsInstance(serializers.loads(serializers.dumps('abc')), unicode)
+
+    def test_negotiate(self):
+        self.assertEqual(serializers.negotiate(None), serializers.JSON)
+        self.assertEqual(serializers.negotiate(['unknown', serializers.JSON]), serializers.JSON)
+        self.assertEqual(serializers.negotiate(serializers.available()), serializers.available()[0])
+
+        with mock.patch('settings.SERVICE_SERIALIZER', serializers.MSGPACK, create = True):
+            self.assertEqual(serializers.preferred(), serializers.available()[0])